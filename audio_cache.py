@@ -0,0 +1,140 @@
+# audio_cache.py
+#
+# The cached_audio folder as a size-bounded LRU cache. Downloads land in a private
+# temporary folder and are moved into place atomically, so a reader never sees a partial
+# file. Every lookup refreshes a file's modification time, which is what eviction treats
+# as its last access: files idle for longer than the TTL go first, then the least
+# recently used until the folder fits the disk budget. Files held by a job in this
+# process are never evicted.
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from helpers import AUDIO_EXTENSIONS, cached_audio_folder, find_audio_location
+
+AUDIO_CACHE_BYTES = int(os.environ.get("AUDIO_CACHE_MB", "2048")) * 1024 * 1024
+AUDIO_CACHE_TTL = int(os.environ.get("AUDIO_CACHE_TTL_HOURS", "72")) * 3600
+TEMP_PREFIX = ".download-"
+STALE_TEMP_SECONDS = 2 * 3600  # temporary folders older than this belong to crashed downloads
+
+_lock = threading.Lock()
+_held = {}            # path -> number of jobs using it
+_download_locks = {}  # video ID -> lock, so one video is only downloaded once at a time
+
+def lookup(video_id: str) -> Optional[str]:
+    """
+    Path of the cached audio for a video, marking it as just used, or None.
+    """
+    path = find_audio_location(video_id)
+    if path:
+        touch(path)
+    return path
+
+def touch(path: str):
+    try:
+        os.utime(path, None)
+    except FileNotFoundError:
+        pass
+
+@contextmanager
+def download_lock(video_id: str):
+    """
+    Serialises downloads of the same video within this process. Callers should look
+    the video up again once they hold the lock.
+    """
+    with _lock:
+        lock = _download_locks.setdefault(video_id, threading.Lock())
+    try:
+        with lock:
+            yield
+    finally:
+        with _lock:
+            if not lock.locked():
+                _download_locks.pop(video_id, None)
+
+def make_temp_dir() -> str:
+    """
+    A private folder for one download, on the same filesystem as the cache so the
+    result can be moved into place atomically.
+    """
+    os.makedirs(cached_audio_folder, exist_ok=True)
+    return tempfile.mkdtemp(prefix=TEMP_PREFIX, dir=cached_audio_folder)
+
+def commit(temp_path: str, video_id: str) -> str:
+    """
+    Atomically moves a finished download into the cache.
+
+    :return: The cached path.
+    """
+    ext = temp_path.rsplit(".", 1)[-1]
+    path = os.path.join(cached_audio_folder, f"{video_id}.{ext}")
+    os.replace(temp_path, path)
+    touch(path)
+    return path
+
+def hold(path: str):
+    """
+    Protects a cached file from eviction until release is called.
+    """
+    with _lock:
+        _held[path] = _held.get(path, 0) + 1
+
+def release(path: str):
+    with _lock:
+        count = _held.get(path, 0) - 1
+        if count > 0:
+            _held[path] = count
+        else:
+            _held.pop(path, None)
+
+def evict(keep: Iterable[str] = (), budget: int = AUDIO_CACHE_BYTES, ttl: float = AUDIO_CACHE_TTL) -> int:
+    """
+    Deletes expired files, then least recently used ones until the cache fits in
+    budget bytes. Held files and those in keep are left alone, so the cache can stay
+    over budget while they are in use.
+
+    :return: Bytes freed.
+    """
+    if not os.path.isdir(cached_audio_folder):
+        return 0
+    now = time.time()
+    with _lock:
+        protected = set(_held) | set(keep)
+
+    entries = []
+    for entry in os.scandir(cached_audio_folder):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.is_dir():
+            if entry.name.startswith(TEMP_PREFIX) and now - stat.st_mtime > STALE_TEMP_SECONDS:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            continue
+        if entry.name.rsplit(".", 1)[-1] in AUDIO_EXTENSIONS:
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    entries.sort()  # least recently used first
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for last_used, size, path in entries:
+        if path in protected:
+            continue
+        if now - last_used <= ttl and total <= budget:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+
+    if freed:
+        logging.info(f"[AudioCache] Evicted {freed / (1024 * 1024):.1f} MB, {total / (1024 * 1024):.1f} MB cached")
+    return freed
@@ -0,0 +1,188 @@
+# audio_chunks.py
+#
+# Splitting long audio into overlapping segments so they can be transcribed in parallel,
+# and stitching the segment transcripts back together without repeating the overlap.
+
+import json
+import re
+import subprocess
+from difflib import SequenceMatcher
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from pydub.utils import mediainfo
+
+CHUNK_SECONDS = 10 * 60     # length of each segment sent to Whisper
+OVERLAP_SECONDS = 5         # audio shared by neighbouring segments so no words are cut
+MIN_OVERLAP_WORDS = 3       # shortest word match trusted as the overlap when stitching
+WORDS_PER_SECOND = 4        # generous speech rate, bounds how far the overlap search looks
+FFMPEG_CHUNK_TIMEOUT = 5 * 60  # seconds FFmpeg may take to cut one segment
+
+def get_audio_seconds(file_path: str) -> float:
+    """
+    Duration of an audio file in seconds, read with ffprobe without decoding the audio.
+    """
+    return float(mediainfo(file_path).get("duration", 0.0))
+
+def probe_codec(source: Union[str, bytes]) -> Optional[str]:
+    """
+    Codec of the first audio stream of a file, or of audio held in memory, via ffprobe.
+    """
+    command = ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name", "-of", "json"]
+    command.append(source if isinstance(source, str) else "pipe:0")
+    result = subprocess.run(
+        command,
+        input=None if isinstance(source, str) else source,
+        capture_output=True,
+        timeout=FFMPEG_CHUNK_TIMEOUT
+    )
+    try:
+        return json.loads(result.stdout)["streams"][0]["codec_name"]
+    except (ValueError, KeyError, IndexError):
+        return None
+
+def chunk_ffmpeg_args(codec: Optional[str]) -> List[str]:
+    """
+    FFmpeg output arguments for one segment, written as Ogg to a pipe. Opus is copied
+    as it is; anything else is resampled to low bitrate 16kHz mono Opus.
+    """
+    if codec == "opus":
+        return ["-c:a", "copy", "-f", "ogg"]
+    return ["-c:a", "libopus", "-b:a", "24k", "-ar", "16000", "-ac", "1", "-f", "ogg"]
+
+def split_audio(
+    source: Union[str, BinaryIO],
+    chunk_seconds: int = CHUNK_SECONDS,
+    overlap_seconds: int = OVERLAP_SECONDS,
+    base_name: Optional[str] = None,
+    total_seconds: Optional[float] = None
+) -> List[Tuple[str, bytes]]:
+    """
+    Split audio into overlapping segments, each cut by its own FFmpeg run so the whole
+    recording is never decoded into memory. Opus audio is stream copied, other codecs
+    are resampled to 16kHz mono Opus one segment at a time.
+
+    :param source: Path to an audio file, or a file-like object holding the audio.
+    :param base_name: Prefix for the segment filenames; defaults to the source file's name.
+    :param total_seconds: Duration of the audio. Required for file-like sources, probed
+                          for paths when not given.
+    :return: List of (filename, ogg bytes) in playback order.
+    """
+    if isinstance(source, str):
+        data = None
+        total_seconds = total_seconds or get_audio_seconds(source)
+    else:
+        source.seek(0)
+        data = source.read()
+        if not total_seconds:
+            raise ValueError("total_seconds is required to split audio held in memory")
+    if base_name is None:
+        base_name = source.rsplit("/", 1)[-1].rsplit(".", 1)[0] if isinstance(source, str) else "audio"
+
+    output_args = chunk_ffmpeg_args(probe_codec(source if data is None else data))
+    step = chunk_seconds - overlap_seconds
+    chunks = []
+    start = 0
+    while True:
+        command = [
+            "ffmpeg", "-v", "error", "-ss", str(start), "-t", str(chunk_seconds),
+            "-i", source if data is None else "pipe:0", "-vn", *output_args, "pipe:1"
+        ]
+        result = subprocess.run(command, input=data, capture_output=True, timeout=FFMPEG_CHUNK_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFmpeg could not cut segment {len(chunks)} of {base_name}: {result.stderr.decode(errors='replace')}")
+        chunks.append((f"{base_name}_{len(chunks):03d}.ogg", result.stdout))
+        if start + chunk_seconds >= total_seconds:
+            break
+        start += step
+    return chunks
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+def _find_overlap(tail: List[str], head: List[str], reach: int) -> Optional[Tuple[int, int]]:
+    """
+    Locate the overlap between the end of one segment and the start of the next: a run
+    of at least MIN_OVERLAP_WORDS shared words that ends within the last `reach` words
+    of the tail and starts within the first `reach` words of the head. Of those, the run
+    closest to the boundary wins, so a phrase that merely recurs nearby is not mistaken
+    for the overlap.
+
+    :return: (index in tail, index in head) where the run starts, or None if there is none.
+    """
+    tail = [_normalize(w) for w in tail]
+    head = [_normalize(w) for w in head]
+    best, best_key = None, None
+    for j in range(min(reach + 1, len(head))):
+        for i in range(len(tail)):
+            size = 0
+            while i + size < len(tail) and j + size < len(head) and tail[i + size] == head[j + size]:
+                size += 1
+            after = len(tail) - (i + size)
+            if size < MIN_OVERLAP_WORDS or after > reach:
+                continue
+            key = (after + j, -size)
+            if best_key is None or key < best_key:
+                best, best_key = (i, j), key
+    return best
+
+def stitch_transcripts(texts: List[str], overlap_seconds: int = OVERLAP_SECONDS) -> str:
+    """
+    Join segment transcripts, dropping the words transcribed twice in each overlap.
+    The end of one segment and the start of the next are aligned on a run of common
+    words near their boundary (see _find_overlap); the text before the run comes from
+    the earlier segment and the run itself onwards from the later one. Without a
+    trustworthy match, the segments are simply joined.
+
+    >>> stitch_transcripts(["the cat sat on the mat and the dog ran", "the dog ran to the park and the cat sat"])
+    'the cat sat on the mat and the dog ran to the park and the cat sat'
+    """
+    reach = max(overlap_seconds * WORDS_PER_SECOND, MIN_OVERLAP_WORDS)
+    window = reach * 2
+    words: List[str] = []
+    for text in texts:
+        next_words = text.split()
+        if not words:
+            words = next_words
+            continue
+
+        tail = words[-window:]
+        match = _find_overlap(tail, next_words[:window], reach)
+        if match is not None:
+            words = words[:len(words) - len(tail) + match[0]] + next_words[match[1]:]
+        else:
+            words = words + next_words
+    return " ".join(words)
+
+class IncrementalStitcher:
+    """
+    Stitches chunk transcripts as they finish, in any order, and hands out the text
+    that can no longer change. Stitching only ever trims the last few words of the text
+    so far (inside the overlap search window), so everything before them is final.
+    """
+    def __init__(self, total_chunks: int, overlap_seconds: int = OVERLAP_SECONDS):
+        self.total_chunks = total_chunks
+        self.overlap_seconds = overlap_seconds
+        self.window = max(overlap_seconds * WORDS_PER_SECOND * 2, MIN_OVERLAP_WORDS)
+        self.texts = {}
+        self.ready = 0          # chunks 0..ready-1 have all finished
+        self.emitted_words = 0
+
+    def add(self, index: int, text: str) -> str:
+        """
+        Record a finished chunk.
+
+        :return: Newly confirmed text, or an empty string if none is confirmed yet.
+        """
+        self.texts[index] = text
+        if index != self.ready:
+            return ""
+        while self.ready in self.texts:
+            self.ready += 1
+
+        words = stitch_transcripts([self.texts[i] for i in range(self.ready)], self.overlap_seconds).split()
+        confirmed = len(words) if self.ready == self.total_chunks else max(len(words) - self.window, 0)
+        if confirmed <= self.emitted_words:
+            return ""
+        new_words = words[self.emitted_words:confirmed]
+        self.emitted_words = confirmed
+        return " ".join(new_words)
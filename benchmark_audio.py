@@ -0,0 +1,92 @@
+"""
+Compare the worker's audio acquisition modes (see video_processing.AUDIO_MODE) on local
+sample files, without touching YouTube.
+
+Each sample stands in for the native stream yt-dlp would download, so "native" is the
+file as-is and the other modes run the FFmpeg step their yt-dlp postprocessor would. For
+every mode this reports the bytes that would be downloaded, the bytes handed to the
+transcription backend, the FFmpeg CPU seconds and the wall time.
+
+Usage:
+    python benchmark_audio.py sample1.webm sample2.m4a [--repeat 3] > bench_output.txt
+
+Note that "mp3" mode really downloads bestaudio (usually a ~160kbps stream) rather than
+the smallest stream, so to compare download sizes pass a bestaudio sample as well.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+# Container for a stream copy of each source codec, as the worker stores it (Opus goes in
+# Ogg, since the transcription backend doesn't accept .opus)
+REMUX_EXTENSIONS = {"opus": "ogg", "vorbis": "ogg", "aac": "m4a", "mp3": "mp3"}
+
+def probe_codec(path: str) -> str:
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name", "-of", "json", path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output)["streams"][0]["codec_name"]
+
+def ffmpeg_command(mode: str, source: str, target_base: str):
+    """
+    The FFmpeg step of a mode, mirroring video_processing.audio_download_options.
+
+    :return: (command or None for no processing, output path)
+    """
+    if mode == "native":
+        return None, source
+    if mode == "remux":
+        target = f"{target_base}.{REMUX_EXTENSIONS.get(probe_codec(source), 'mka')}"
+        return ["ffmpeg", "-y", "-v", "error", "-i", source, "-vn", "-acodec", "copy", target], target
+    if mode == "resample":
+        target = f"{target_base}.ogg"
+        return ["ffmpeg", "-y", "-v", "error", "-i", source, "-vn", "-c:a", "libopus", "-b:a", "24k", "-ar", "16000", "-ac", "1", target], target
+    if mode == "mp3":
+        target = f"{target_base}.mp3"
+        return ["ffmpeg", "-y", "-v", "error", "-i", source, "-vn", "-c:a", "libmp3lame", "-b:a", "64k", "-ar", "16000", "-ac", "1", target], target
+    raise ValueError(f"Unknown audio mode: {mode}")
+
+def run_mode(mode: str, source: str, workdir: str) -> dict:
+    command, target = ffmpeg_command(mode, source, os.path.join(workdir, f"{mode}_{os.path.basename(source)}"))
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start_time = time.perf_counter()
+    if command:
+        subprocess.run(command, check=True)
+    wall_seconds = time.perf_counter() - start_time
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu_seconds = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        "downloaded_bytes": os.path.getsize(source),
+        "output_bytes": os.path.getsize(target),
+        "cpu_seconds": cpu_seconds,
+        "wall_seconds": wall_seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples", nargs="+", help="Local audio files standing in for downloaded streams")
+    parser.add_argument("--modes", default="native,remux,resample,mp3")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode and sample; the fastest is kept")
+    args = parser.parse_args()
+
+    print(f"{'sample':<30} {'mode':<9} {'download MB':>12} {'output MB':>10} {'CPU s':>8} {'wall s':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for sample in args.samples:
+            for mode in args.modes.split(","):
+                runs = [run_mode(mode, sample, workdir) for _ in range(args.repeat)]
+                best = min(runs, key=lambda run: run["wall_seconds"])
+                print(
+                    f"{os.path.basename(sample)[:30]:<30} {mode:<9} "
+                    f"{best['downloaded_bytes'] / 1e6:>12.2f} {best['output_bytes'] / 1e6:>10.2f} "
+                    f"{best['cpu_seconds']:>8.2f} {best['wall_seconds']:>8.2f}"
+                )
+
+if __name__ == "__main__":
+    main()
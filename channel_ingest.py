@@ -0,0 +1,82 @@
+# channel_ingest.py
+#
+# Bulk transcription of a channel's uploads through the worker queue: discovers the
+# uploads page by page, skips the ones already cached and hands the rest to the queue in
+# bounded batches, reporting progress as it goes.
+#
+# Usage:
+#     python channel_ingest.py CHANNEL [--start 01/01/2024] [--end 06/01/2024] [--max 200]
+
+import argparse
+import logging
+from typing import Dict, Generator, Optional
+
+from transcripts import BULK_BATCH_SIZE, get_cached_transcripts, iter_transcripts
+from video_processing import iter_channel_uploads, resolve_channel_id
+
+def ingest_channel(
+    channel: str,
+    task_type: str = "youtube",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    max_videos: Optional[int] = None,
+    batch_size: int = BULK_BATCH_SIZE
+) -> Generator[Dict, None, None]:
+    """
+    Makes sure every upload of a channel in the date range has a transcript.
+
+    Each page of uploads is checked against the cache in one MGET as it is discovered.
+    Cached videos are reported right away; the others are queued batch_size at a time
+    once discovery is done (see transcripts.iter_transcripts).
+
+    :param channel: Channel URL, username or ID.
+    :param start_date: Only uploads published on or after this mm/dd/yyyy date.
+    :param end_date: Only uploads published before this mm/dd/yyyy date.
+    :return: Yields progress dicts: {"video_id", "status" ('cached', 'complete' or
+             'failed'), "transcript", "done", "total"}. total is the number of videos
+             discovered so far and is final once the first uncached video is reported.
+    """
+    channel_id = resolve_channel_id(channel)
+    if not channel_id:
+        raise ValueError(f"Channel not found: {channel}")
+
+    total, done = 0, 0
+    misses = []
+    for page in iter_channel_uploads(channel_id, start_date, end_date):
+        video_ids = [video_id for video_id, _ in page]
+        if max_videos is not None:
+            video_ids = video_ids[:max_videos - total]
+        total += len(video_ids)
+
+        for video_id, transcript in get_cached_transcripts(video_ids, task_type).items():
+            if transcript:
+                done += 1
+                yield {"video_id": video_id, "status": "cached", "transcript": transcript, "done": done, "total": total}
+            else:
+                misses.append(video_id)
+        if max_videos is not None and total >= max_videos:
+            break
+
+    logging.info(f"[Ingest] Channel {channel_id}: {total} upload(s), {len(misses)} to transcribe")
+    for video_id, transcript in iter_transcripts(misses, task_type, batch_size):
+        done += 1
+        yield {
+            "video_id": video_id,
+            "status": "complete" if transcript else "failed",
+            "transcript": transcript,
+            "done": done,
+            "total": total
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe a channel's uploads through the worker queue.")
+    parser.add_argument("channel", help="Channel URL, username or ID")
+    parser.add_argument("--task-type", default="youtube", choices=["youtube", "audio"])
+    parser.add_argument("--start", help="Only uploads on or after this mm/dd/yyyy date")
+    parser.add_argument("--end", help="Only uploads before this mm/dd/yyyy date")
+    parser.add_argument("--max", type=int, help="Most recent uploads to process at most")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    for progress in ingest_channel(args.channel, args.task_type, args.start, args.end, args.max, args.batch_size):
+        print(f"[{progress['done']}/{progress['total']}] {progress['video_id']}: {progress['status']}")
@@ -0,0 +1,115 @@
+# channel_watcher.py
+#
+# Polls the RSS feeds of watched channels and enqueues new uploads on the background
+# lane, so their transcripts are usually cached before anyone asks for them. Feed state
+# (ETag, Last-Modified and the uploads already seen) lives in Redis, so any number of
+# workers can run the watcher and each feed is still only polled once per interval.
+
+import calendar
+import logging
+import threading
+import time
+from typing import List
+
+from redis_wrapper import value_cache, BACKGROUND_LANE
+from job_queue import enqueue_job, status_key, transcript_key
+from video_processing import get_channel_feed
+
+WATCH_INTERVAL = 15 * 60      # seconds between polls of each feed
+WATCH_MAX_AGE = 2 * 24 * 3600  # uploads older than this are never enqueued, e.g. on the first poll
+WATCH_MAX_QUEUED = 100         # background jobs allowed to wait before new uploads are skipped
+WATCH_TASK_TYPE = "youtube"
+SEEN_EXPIRATION = 30 * 24 * 3600
+
+def feed_state_key(channel_id: str) -> str:
+    return f"watcher:feed:{channel_id}"
+
+def seen_videos_key(channel_id: str) -> str:
+    return f"watcher:seen:{channel_id}"
+
+def poll_lock_key(channel_id: str) -> str:
+    return f"watcher:poll:{channel_id}"
+
+def is_cached_or_queued(video_id: str, task_type: str = WATCH_TASK_TYPE) -> bool:
+    """
+    Whether a video already has a transcript, or a job for it is queued or running.
+    """
+    pipe = value_cache.pipeline(transaction=False)
+    pipe.exists(transcript_key("youtube", video_id), transcript_key("audio", video_id))
+    pipe.get(status_key(task_type, video_id))
+    cached, status = pipe.execute()
+    return cached > 0 or status in ("queued", "in_progress")
+
+def poll_channel(channel_id: str, methods: List[str]) -> List[str]:
+    """
+    Fetches a channel's feed if it changed since the last poll and enqueues background
+    jobs for its new, recent uploads.
+
+    :return: IDs of the videos enqueued.
+    """
+    state = value_cache.hgetall(feed_state_key(channel_id))
+    feed = get_channel_feed(channel_id, etag=state.get("etag"), modified=state.get("modified"))
+    if getattr(feed, "status", None) == 304:
+        logging.info(f"[Watcher] Feed unchanged for channel {channel_id}")
+        return []
+    if feed.get("bozo") and not feed.entries:
+        logging.warning(f"[Watcher] Could not read feed for channel {channel_id}: {feed.get('bozo_exception')}")
+        return []
+
+    new_state = {key: feed.get(key) for key in ("etag", "modified") if feed.get(key)}
+    if new_state:
+        value_cache.hset(feed_state_key(channel_id), mapping=new_state)
+
+    # Skip everything already seen, in one round trip
+    entries = [entry for entry in feed.entries if entry.get("yt_videoid")]
+    pipe = value_cache.pipeline(transaction=False)
+    for entry in entries:
+        pipe.sismember(seen_videos_key(channel_id), entry["yt_videoid"])
+    unseen = [entry for entry, seen in zip(entries, pipe.execute()) if not seen]
+
+    enqueued = []
+    now = time.time()
+    for entry in unseen:
+        video_id = entry["yt_videoid"]
+        value_cache.sadd(seen_videos_key(channel_id), video_id)
+        published = entry.get("published_parsed")
+        if published and now - calendar.timegm(published) > WATCH_MAX_AGE:
+            continue
+        if is_cached_or_queued(video_id):
+            continue
+        if value_cache.xlen(BACKGROUND_LANE) >= WATCH_MAX_QUEUED:
+            logging.warning(f"[Watcher] Background lane is full, skipping video {video_id} from channel {channel_id}")
+            continue
+        enqueue_job({
+            "video_id": video_id,
+            "task_type": WATCH_TASK_TYPE,
+            "methods": methods,
+            "enqueued_at": now,
+            "source": "watcher"
+        }, BACKGROUND_LANE)
+        enqueued.append(video_id)
+    value_cache.expire(seen_videos_key(channel_id), SEEN_EXPIRATION)
+
+    if enqueued:
+        logging.info(f"[Watcher] Enqueued {len(enqueued)} new upload(s) from channel {channel_id}: {enqueued}")
+    return enqueued
+
+def watch_channels(channel_ids: List[str], methods: List[str], interval: float = WATCH_INTERVAL):
+    """
+    Polls every channel once per interval, forever. A per-channel lock that expires
+    after the interval makes sure only one worker polls a feed each time.
+    """
+    logging.info(f"[Watcher] Watching {len(channel_ids)} channel(s) every {interval}s")
+    while True:
+        for channel_id in channel_ids:
+            try:
+                if value_cache.set(poll_lock_key(channel_id), "1", nx=True, ex=int(interval)):
+                    poll_channel(channel_id, methods)
+            except Exception as e:
+                logging.exception(f"[Watcher] Polling channel {channel_id} failed: {e}")
+        time.sleep(min(interval, 60))
+
+def start_channel_watcher(channel_ids: List[str], methods: List[str], interval: float = WATCH_INTERVAL) -> threading.Thread:
+    thread = threading.Thread(target=watch_channels, args=(channel_ids, methods, interval), name="watcher", daemon=True)
+    thread.start()
+    return thread
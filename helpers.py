@@ -3,6 +3,7 @@ import logging
 import os
 import re
 import requests
+from typing import Optional
 
 import openai
 from bs4 import BeautifulSoup
@@ -54,6 +55,19 @@ def to_video_url(id: str) -> str:
 def to_audio_location(id: str) -> str: 
     return os.path.join(cached_audio_folder, id + ".mp3")
 
+# Audio containers the transcription backend accepts, in order of preference
+AUDIO_EXTENSIONS = ["mp3", "webm", "m4a", "ogg"]
+
+def find_audio_location(id: str) -> Optional[str]:
+    """
+    Path of the cached audio for a video in any accepted format, or None if not cached.
+    """
+    for ext in AUDIO_EXTENSIONS:
+        path = os.path.join(cached_audio_folder, f"{id}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
 def to_transcript_location(id: str) -> str:
     return os.path.join(cached_transcripts_folder, id + ".txt")
 
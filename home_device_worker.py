@@ -1,25 +1,157 @@
 # home_device_worker.py
 
+import io
 import os
+import socket
+import threading
 import time
-import json
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from string import printable
-from typing import Optional
+from typing import BinaryIO, Callable, Optional, Tuple, Union
 
-from youtube_transcript_api import YouTubeTranscriptApi
-from groq import Groq
+from youtube_transcript_api import TooManyRequests, YouTubeRequestFailed, YouTubeTranscriptApi
+from groq import Groq, RateLimitError
 
-from redis_wrapper import value_cache, QUEUE_NAME, WORKER_HEARTBEAT
-from helpers import to_audio_location
-from video_processing import download_video_mp3
+import audio_cache
+from audio_chunks import CHUNK_SECONDS, OVERLAP_SECONDS, IncrementalStitcher, get_audio_seconds, split_audio, stitch_transcripts
+from channel_watcher import is_cached_or_queued, start_channel_watcher
+from metrics import StageTimings, record_stage_timings, start_metrics_server, time_stage
+from pipeline_stages import StagedPipeline
+from rate_limiter import RateLimiter, rate_limited
+from redis_wrapper import value_cache, BACKGROUND_LANE, FAST_LANE, REDIS_SOCKET_TIMEOUT, SLOW_LANE, blocking_ms, encode_value
+from job_queue import (
+    Job,
+    STATUS_EXPIRATION,
+    ack_job,
+    advertise_worker,
+    append_partial_transcript,
+    claim_jobs,
+    deregister_worker,
+    ensure_consumer_groups,
+    migrate_legacy_queues,
+    estimate_job_seconds,
+    prune_workers,
+    publish_job_event,
+    record_job_duration,
+    renew_leases,
+    requeue_expired_leases,
+    requeue_job,
+    reset_partial_transcript,
+    status_key as get_status_key,
+    transcript_key
+)
+from video_processing import AUDIO_HANDOFF, download_video_audio, fetch_video_audio_bytes
 
 logging.basicConfig(level=logging.INFO)
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 assert GROQ_API_KEY is not None, "GROQ_API_KEY environment variable is not set."
 groq_client = Groq(api_key=GROQ_API_KEY)
 
+# Calls per minute shared by every worker, with the burst allowed on top. Groq's
+# Whisper limit is per API key, so all workers using the key share one bucket.
+GROQ_RATE_PER_MINUTE = float(os.environ.get("GROQ_RATE_PER_MINUTE", "20"))
+GROQ_BURST = int(os.environ.get("GROQ_BURST", "4"))
+YOUTUBE_RATE_PER_MINUTE = float(os.environ.get("YOUTUBE_RATE_PER_MINUTE", "60"))
+YOUTUBE_BURST = int(os.environ.get("YOUTUBE_BURST", "10"))
+groq_limiter = RateLimiter("groq", GROQ_RATE_PER_MINUTE, GROQ_BURST)
+youtube_limiter = RateLimiter("youtube", YOUTUBE_RATE_PER_MINUTE, YOUTUBE_BURST)
+
+# After this many consecutive fast-lane jobs, the slow lane gets the next pick if it has work
+FAST_LANE_BURST = int(os.environ.get("FAST_LANE_BURST", "4"))
+
+# Consumer name in the job group; leases are held per worker
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+HEARTBEAT_INTERVAL = 30    # seconds between heartbeats, well under LEASE_TIMEOUT and WORKER_TTL
+REAP_INTERVAL = 60         # seconds between sweeps for other workers' expired leases
+MAX_JOB_TIME = 30 * 60     # stop renewing a lease after this long so a hung job gets requeued
+CLAIM_BLOCK_MS = 30 * 1000
+# Jobs run in parallel by this process. Most of a job is spent waiting on yt-dlp, Groq
+# or YouTube, so this can be well above the CPU count.
+WORKER_CONCURRENCY = max(1, int(os.environ.get("WORKER_CONCURRENCY", "1")))
+
+# Whisper calls in flight at once for a single chunked (long) video
+CHUNK_CONCURRENCY = max(1, int(os.environ.get("CHUNK_CONCURRENCY", "4")))
+
+# "pool" runs each job start to finish on one of WORKER_CONCURRENCY threads. "staged"
+# splits jobs into caption, download, transcribe and store stages, each with its own
+# threads, so one job's download overlaps another's transcription.
+WORKER_MODE = os.environ.get("WORKER_MODE", "pool")
+# Threads per stage in staged mode, overridable like STAGE_WORKERS="download=3,transcribe=4"
+STAGE_WORKERS = {"captions": 2, "download": 2, "transcribe": 2, "store": 1}
+STAGE_WORKERS.update({
+    name: int(count)
+    for name, count in (
+        entry.split("=") for entry in os.environ.get("STAGE_WORKERS", "").split(",") if "=" in entry
+    )
+})
+# Jobs allowed in the staged pipeline at once. Also the size of every stage queue, so
+# routing a job back to an earlier stage can never block on a full queue.
+STAGED_MAX_IN_FLIGHT = max(1, int(os.environ.get("STAGED_MAX_IN_FLIGHT", "8")))
+
+# Channels whose new uploads are pre-transcribed on the background lane, e.g.
+# WATCH_CHANNELS="UC...,UC...", and the methods those jobs may use
+WATCH_CHANNELS = [channel for channel in os.environ.get("WATCH_CHANNELS", "").split(",") if channel]
+WATCH_METHODS = os.environ.get("WATCH_METHODS", "youtube,audio").split(",")
+
+# Serves the stage timing histograms at /metrics for Prometheus when set
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# "sequential" tries a job's methods one after another. "hedged" starts the caption fetch
+# and the audio download together: caption jobs on the fast lane download the audio ahead
+# into the cache for their slow-lane fallback, and jobs on the slow lane keep whichever
+# transcript arrives first.
+FETCH_MODE = os.environ.get("FETCH_MODE", "sequential")
+# With hedging, for jobs that prefer captions: "captions_first" downloads ahead but only
+# calls Whisper once captions have failed; "race" transcribes as soon as the download
+# finishes. Jobs that prefer Whisper always use it, with captions only as the fallback.
+HEDGE_POLICY = os.environ.get("HEDGE_POLICY", "captions_first")
+
+if WORKER_MODE == "staged":
+    JOB_SLOTS = STAGED_MAX_IN_FLIGHT
+    # Audio jobs dominate queue time and progress at the pace of the slower audio stage
+    ADVERTISED_SLOTS = min(STAGE_WORKERS["download"], STAGE_WORKERS["transcribe"])
+else:
+    JOB_SLOTS = WORKER_CONCURRENCY
+    ADVERTISED_SLOTS = WORKER_CONCURRENCY
+
+# Every job this worker holds a lease on, by stream entry ID, with the time it was claimed
+held_jobs = {}
+held_jobs_lock = threading.Lock()
+heartbeat_thread = None
+
+# Created once so a restarted main_loop can't exceed JOB_SLOTS while old jobs finish
+job_executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="job")
+job_slots = threading.BoundedSemaphore(JOB_SLOTS)
+# Runs the two sides of hedged jobs, separate from job_executor so they can't starve it
+hedge_executor = ThreadPoolExecutor(max_workers=2 * WORKER_CONCURRENCY, thread_name_prefix="hedge")
+staged_pipeline = None
+
+# Downloaded audio: a file path, or (filename, bytes, duration in seconds) held in memory
+Audio = Union[str, Tuple[str, bytes, float]]
+
+def is_youtube_rate_limit(error: Exception) -> bool:
+    return isinstance(error, TooManyRequests) or (isinstance(error, YouTubeRequestFailed) and "429" in str(error))
+
+@rate_limited(youtube_limiter, is_youtube_rate_limit)
+def fetch_manual_captions(video_id: str) -> list:
+    transcript_obj = YouTubeTranscriptApi.list_transcripts(video_id).find_manually_created_transcript(["en", "en-US"])
+    return transcript_obj.fetch()
+
+@rate_limited(groq_limiter, lambda error: isinstance(error, RateLimitError))
+def whisper_transcription(model: str, file) -> str:
+    """
+    One Groq Whisper call, taking a token from the shared bucket first.
+
+    :param file: An open audio file or a (filename, bytes) tuple.
+    """
+    if hasattr(file, "seek"):
+        # A retry has to upload the file from the start again
+        file.seek(0)
+    return groq_client.audio.transcriptions.create(model=model, file=file).text
+
 def get_youtube_str_transcript(video_id: str) -> Optional[str]:
     """
     Get the transcript of a video from the YouTube Transcript API if manually generated English 
@@ -29,8 +161,7 @@ def get_youtube_str_transcript(video_id: str) -> Optional[str]:
     :return: The transcript string if found, otherwise None.
     """
     try:
-        transcript_obj = YouTubeTranscriptApi.list_transcripts(video_id).find_manually_created_transcript(["en", "en-US"])
-        transcript_list = transcript_obj.fetch()
+        transcript_list = fetch_manual_captions(video_id)
         transcript_text = " ".join([item["text"] for item in transcript_list])
         transcript_text = transcript_text.replace("\n", " ")
         transcript_text = "".join(ch for ch in transcript_text if ch in printable)
@@ -39,36 +170,143 @@ def get_youtube_str_transcript(video_id: str) -> Optional[str]:
         logging.warning(f"YouTube Transcript API failed for video_id: {video_id}")
         return None
 
-def create_whisper_transcript(video_id: str, model: str = "whisper-large-v3") -> str:
+def create_whisper_transcript(
+    video_id: str,
+    model: str = "whisper-large-v3",
+    on_segment: Optional[Callable[[str], None]] = None,
+    timings: Optional[StageTimings] = None
+) -> str:
     """
     Generate a transcript using Groq's Whisper v3 API.
     
     :param video_id: The video ID of the YouTube video we want to create a transcript for.
     :param model: The model to use. Default is 'whisper-large-v3'.
+    :param on_segment: Called with each newly finished stretch of transcript on long videos.
+    :param timings: Receives the download, transcode and transcription times.
+    :return: The transcript text generated by Whisper.
+    :raises Exception: If the file isn't found or any unexpected error occurs.
+    """
+    audio = download_audio(video_id, timings=timings)
+    try:
+        return transcribe_audio(audio, model, on_segment, timings)
+    finally:
+        release_audio(audio)
+
+def download_audio(
+    video_id: str,
+    cancel_event: Optional[threading.Event] = None,
+    timings: Optional[StageTimings] = None
+) -> Audio:
+    """
+    Download a video's audio for transcription. With AUDIO_HANDOFF="memory" the audio is
+    piped into memory and never touches the disk; if that fails, it falls back to
+    downloading a file into cached_audio. Cached files are held (safe from eviction)
+    until release_audio is called.
+
+    :param cancel_event: Setting it aborts the download.
+    """
+    if AUDIO_HANDOFF == "memory":
+        # Audio downloaded ahead by a hedged caption job is already on disk
+        cached_path = audio_cache.lookup(video_id)
+        if cached_path:
+            audio_cache.hold(cached_path)
+            return cached_path
+        try:
+            return fetch_video_audio_bytes(video_id, cancel_event=cancel_event, timings=timings)
+        except Exception as e:
+            if cancel_event and cancel_event.is_set():
+                raise
+            logging.warning(f"In-memory audio fetch failed for video_id: {video_id}, downloading to a file instead: {e}")
+    file_path = download_video_audio(video_id, cancel_event=cancel_event, timings=timings)
+    audio_cache.hold(file_path)
+    return file_path
+
+def transcribe_audio(
+    audio: Audio,
+    model: str = "whisper-large-v3",
+    on_segment: Optional[Callable[[str], None]] = None,
+    timings: Optional[StageTimings] = None
+) -> str:
+    if isinstance(audio, str):
+        return transcribe_audio_file(audio, model, on_segment, timings)
+    return transcribe_audio_bytes(*audio, model=model, on_segment=on_segment, timings=timings)
+
+def release_audio(audio: Optional[Audio]):
+    """
+    Hands downloaded audio back to the audio cache once a job is done with it. The file
+    stays cached, so a retry or fallback doesn't download it again; the cache evicts it
+    when it runs out of budget. In-memory audio just goes out of scope.
+    """
+    if isinstance(audio, str):
+        audio_cache.release(audio)
+
+def transcribe_audio_bytes(
+    filename: str,
+    data: bytes,
+    seconds: float,
+    model: str = "whisper-large-v3",
+    on_segment: Optional[Callable[[str], None]] = None,
+    timings: Optional[StageTimings] = None
+) -> str:
+    """
+    Transcribe audio held in memory, uploading the buffer directly. Long audio is
+    chunked just like transcribe_audio_file.
+
+    :param filename: Name sent with the upload; its extension tells Groq the format.
+    :param seconds: Duration of the audio, as reported by yt-dlp.
+    """
+    logging.info(f"In-memory audio size for {filename}: {len(data) / (1024 * 1024):.2f} MB")
+    if seconds > CHUNK_SECONDS + OVERLAP_SECONDS:
+        return transcribe_chunked(io.BytesIO(data), model, on_segment, name=filename, timings=timings, seconds=seconds)
+
+    logging.info(f"Starting transcription for: {filename}")
+    start_time = time.time()
+    with time_stage(timings, "transcription"):
+        transcript = whisper_transcription(model, (filename, data))
+    logging.info(f"Transcription completed in {time.time() - start_time:.2f} seconds for {filename}")
+    return transcript
+
+def transcribe_audio_file(
+    file_path: str,
+    model: str = "whisper-large-v3",
+    on_segment: Optional[Callable[[str], None]] = None,
+    timings: Optional[StageTimings] = None
+) -> str:
+    """
+    Transcribe a downloaded audio file with Groq's Whisper API. Leaves the file in place.
+    Audio longer than one chunk is split into overlapping chunks that are transcribed in
+    parallel, so latency tracks the longest chunk rather than the whole video.
+
+    :param file_path: Path to the audio file.
+    :param model: The model to use. Default is 'whisper-large-v3'.
+    :param on_segment: Called, in order, with each stretch of the transcript that is
+                       final while a chunked transcription is still running.
+    :param timings: Receives the transcription time, and the time spent splitting
+                    long audio as transcode time.
     :return: The transcript text generated by Whisper.
     :raises Exception: If the file isn't found or any unexpected error occurs.
     """
-    download_video_mp3(video_id)
-    file_path = to_audio_location(video_id)
     try:
         file_size = os.path.getsize(file_path)
         file_size_mb = file_size / (1024 * 1024)  # Convert to MB
         logging.info(f"File size for {file_path}: {file_size_mb:.2f} MB")
 
+        seconds = get_audio_seconds(file_path)
+        if seconds > CHUNK_SECONDS + OVERLAP_SECONDS:
+            return transcribe_chunked(file_path, model, on_segment, timings=timings, seconds=seconds)
+
         with open(file_path, "rb") as audio_file:
             logging.info(f"Starting transcription for: {file_path}")
             start_time = time.time()
 
             # Make the API call
-            transcript = groq_client.audio.transcriptions.create(
-                model=model,
-                file=audio_file
-            )
+            with time_stage(timings, "transcription"):
+                transcript = whisper_transcription(model, audio_file)
             
             end_time = time.time()
             logging.info(f"Transcription completed in {end_time - start_time:.2f} seconds for {file_path}")
 
-            return transcript.text
+            return transcript
 
     except FileNotFoundError as e:
         logging.error(f"File not found: {file_path}")
@@ -77,41 +315,208 @@ def create_whisper_transcript(video_id: str, model: str = "whisper-large-v3") ->
     except Exception as e:
         logging.error(f"An unexpected error occurred: {str(e)}")
         raise Exception(f"An unexpected error occurred: {str(e)}") from e
+
+def transcribe_chunked(
+    source: Union[str, BinaryIO],
+    model: str = "whisper-large-v3",
+    on_segment: Optional[Callable[[str], None]] = None,
+    name: Optional[str] = None,
+    timings: Optional[StageTimings] = None,
+    seconds: Optional[float] = None
+) -> str:
+    """
+    Split audio into overlapping chunks, transcribe up to CHUNK_CONCURRENCY of them at a
+    time and stitch the results back together in order. As soon as a leading run of
+    chunks is done, the confirmed part of the transcript is passed to on_segment.
+
+    :param source: Path to the audio file, or a buffer holding the audio.
+    :param name: Name for the audio in logs and chunk filenames; defaults to the path.
+    :param seconds: Duration of the audio, probed from the file when not given.
+    """
+    file_path = name or source
+    with time_stage(timings, "transcode"):
+        chunks = split_audio(source, base_name=file_path.rsplit("/", 1)[-1].rsplit(".", 1)[0], total_seconds=seconds)
+    logging.info(f"Starting chunked transcription for: {file_path} ({len(chunks)} chunks)")
+    start_time = time.time()
+
+    def transcribe_chunk(chunk):
+        filename, data = chunk
+        return whisper_transcription(model, (filename, data))
+
+    texts = [None] * len(chunks)
+    stitcher = IncrementalStitcher(len(chunks))
+    # Chunks run in parallel, so the stage gets the wall time rather than their sum
+    with time_stage(timings, "transcription"), ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY, thread_name_prefix="chunk") as executor:
+        futures = {executor.submit(transcribe_chunk, chunk): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            i = futures[future]
+            texts[i] = future.result()
+            segment = stitcher.add(i, texts[i])
+            if segment and on_segment:
+                try:
+                    on_segment(segment)
+                except Exception as e:
+                    logging.warning(f"Could not publish transcript segment for {file_path}: {e}")
+
+    logging.info(f"Chunked transcription completed in {time.time() - start_time:.2f} seconds for {file_path}")
+    return stitch_transcripts(texts)
+
+def partial_transcript_publisher(video_id: str, task_type: str) -> Callable[[str], None]:
+    """
+    Clears any partial transcript from an earlier attempt and returns an on_segment
+    callback that streams segments to get_transcript's readers.
+    """
+    reset_partial_transcript(video_id)
+    return lambda text: append_partial_transcript(video_id, task_type, text)
+
+def prefetch_audio(video_id: str, cancel_event: threading.Event):
+    """
+    Downloads a video's audio into the audio cache in the background, so a slow-lane
+    fallback finds it there. Setting cancel_event aborts the download.
+    """
+    def download():
+        try:
+            download_video_audio(video_id, cancel_event=cancel_event)
+        except Exception as e:
+            if not cancel_event.is_set():
+                logging.warning(f"[Worker] Audio prefetch failed for video_id={video_id}: {e}")
+
+    logging.info(f"[Worker] Prefetching audio while fetching captions for video_id={video_id}")
+    hedge_executor.submit(download)
+
+def hedged_transcript(
+    video_id: str,
+    task_type: str,
+    methods: list,
+    policy: str = HEDGE_POLICY,
+    timings: Optional[StageTimings] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Fetches captions and downloads the audio at the same time. If captions come first
+    in methods, the first valid transcript wins; if Whisper does, captions are only
+    used when it fails. The other side is cancelled: a download in progress is aborted,
+    while a Whisper call already in flight runs to completion and is discarded.
+
+    :param methods: The job's methods in order of preference.
+    :param policy: For jobs preferring captions, "captions_first" holds the Whisper call
+                   until captions have failed, "race" transcribes as soon as the
+                   download finishes.
+    :param timings: Receives each side's stage times. They overlap, so they add up to
+                    more than the job took.
+    :return: (transcript, method), or (None, None) if both sides failed.
+    """
+    cancel_event = threading.Event()
+    captions_done = threading.Event()
+    captions = {}
+
+    def fetch_captions():
+        try:
+            with time_stage(timings, "captions"):
+                captions["transcript"] = get_youtube_str_transcript(video_id)
+            return captions["transcript"]
+        finally:
+            captions_done.set()
+
+    def fetch_audio():
+        audio = download_audio(video_id, cancel_event, timings)
+        try:
+            if prefer_captions and policy == "captions_first":
+                captions_done.wait()
+                if captions.get("transcript"):
+                    return None
+            if cancel_event.is_set():
+                return None
+            return transcribe_audio(audio, on_segment=partial_transcript_publisher(video_id, task_type), timings=timings)
+        finally:
+            release_audio(audio)
+
+    prefer_captions = methods[0] == "youtube"
+    logging.info(f"[Worker] Hedging captions and audio ({policy if prefer_captions else 'audio_first'}) for video_id={video_id}")
+    futures = {hedge_executor.submit(fetch_captions): "youtube", hedge_executor.submit(fetch_audio): "audio"}
+    # Whisper was asked for, so its result is awaited first even if captions arrive sooner
+    completed = as_completed(futures) if prefer_captions else sorted(futures, key=lambda f: futures[f] != "audio")
+    try:
+        for future in completed:
+            method = futures[future]
+            try:
+                transcript = future.result()
+            except Exception as e:
+                if not cancel_event.is_set():
+                    logging.exception(f"[Worker] Exception using method '{method}' for video={video_id}: {e}")
+                continue
+            if transcript:
+                logging.info(f"[Worker] Method '{method}' won the hedge for video_id={video_id}")
+                return transcript, method
+            logging.warning(f"[Worker] Method '{method}' failed or returned no transcript for video_id={video_id}")
+        return None, None
     finally:
-        # Clean up the audio file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        cancel_event.set()
 
-def process_job(video_id: str, task_type: str):
+def get_fallback_order(task_type: str) -> list:
+    if task_type == "audio":
+        return ["audio", "youtube"]
+    return ["youtube", "audio"]
+
+def process_job(
+    video_id: str,
+    task_type: str,
+    methods: Optional[list] = None,
+    fast_lane: bool = False,
+    timings: Optional[StageTimings] = None
+) -> Optional[list]:
     """
     Executes the correct transcription method based on task_type.
     If the first attempt fails or returns None, fallback to the other method.
     If everything fails, set transcript_status to 'failed' in Redis.
+
+    :param methods: Methods still to try, defaults to the full fallback order for task_type.
+    :param fast_lane: The job came from the fast lane. Instead of running Whisper here,
+                      the job should move to the slow lane so it doesn't hold up caption jobs.
+    :param timings: Receives the time spent in each stage and the method that succeeded.
+    :return: The methods left to try on the slow lane if the job stopped early, otherwise None.
     """
-    status_key = f"transcript_status:{task_type}:{video_id}"
-    value_cache.set(status_key, "in_progress")
+    status_key = get_status_key(task_type, video_id)
+    # Expires so a job lost outside the lease system can't block re-enqueueing forever
+    value_cache.set(status_key, "in_progress", ex=STATUS_EXPIRATION)
 
     # Determine fallback order
-    if task_type == "audio":
-        fallback_order = ["audio", "youtube"]
-    else:
-        fallback_order = ["youtube", "audio"]
+    fallback_order = methods or get_fallback_order(task_type)
 
     transcript = None
     final_method_used = None
 
+    prefetch_cancel = None
+    if FETCH_MODE == "hedged" and fast_lane and fallback_order[:2] == ["youtube", "audio"]:
+        # Whisper never runs on the fast lane, but its download can start now so the
+        # slow-lane fallback finds the audio cached
+        prefetch_cancel = threading.Event()
+        prefetch_audio(video_id, prefetch_cancel)
+    elif FETCH_MODE == "hedged" and not fast_lane and {"youtube", "audio"} <= set(fallback_order):
+        transcript, final_method_used = hedged_transcript(video_id, task_type, fallback_order, timings=timings)
+        fallback_order = []
+
     # Try each method in fallback_order until we succeed
-    for method in fallback_order:
+    for i, method in enumerate(fallback_order):
+        if method == "audio" and fast_lane:
+            remaining = fallback_order[i:]
+            logging.info(f"[Worker] Moving video_id={video_id} to the slow lane for methods {remaining}")
+            value_cache.set(status_key, "queued", ex=STATUS_EXPIRATION)
+            return remaining
+
         logging.info(f"[Worker] Attempting transcription with method '{method}' for video ID: {video_id}")
         try:
             logging.info(f"[Worker] Attempting method '{method}' for video_id={video_id}")
             if method == "audio":
-                transcript = create_whisper_transcript(video_id)
+                transcript = create_whisper_transcript(video_id, on_segment=partial_transcript_publisher(video_id, task_type), timings=timings)
             else:
-                transcript = get_youtube_str_transcript(video_id)
+                with time_stage(timings, "captions"):
+                    transcript = get_youtube_str_transcript(video_id)
 
             if transcript:
                 final_method_used = method
+                if prefetch_cancel:
+                    # Captions worked, the audio isn't needed
+                    prefetch_cancel.set()
                 break
             else:
                 logging.warning(f"[Worker] Method '{method}' failed or returned no transcript for video_id={video_id}")
@@ -119,54 +524,331 @@ def process_job(video_id: str, task_type: str):
         except Exception as e:
             logging.exception(f"[Worker] Exception using method '{method}' for video={video_id}: {e}")
 
-    if transcript and final_method_used:
+    if timings:
+        timings.method = final_method_used
+    with time_stage(timings, "store"):
+        store_job_result(video_id, task_type, transcript, final_method_used)
+    return None
+
+def store_job_result(video_id: str, task_type: str, transcript: Optional[str], method: Optional[str]):
+    """
+    Saves the transcript and clears the job status, or marks the job as failed if no
+    method produced one. Either way, waiters are notified.
+    """
+    status_key = get_status_key(task_type, video_id)
+    if transcript and method:
         # Save the transcript
-        transcript_key = f"transcript:{final_method_used}:{video_id}"
-        value_cache.set(transcript_key, transcript, ex=60 * 60 * 24 * 7)  # e.g. 7 days
-        logging.info(f"[Worker] Stored {final_method_used} transcript for {video_id}")
+        value_cache.set(transcript_key(method, video_id), encode_value(transcript), ex=60 * 60 * 24 * 7)  # e.g. 7 days
+        logging.info(f"[Worker] Stored {method} transcript for {video_id}")
 
         # Remove the status key or set to something meaning "complete"
         value_cache.delete(status_key)
+        publish_job_event(video_id, task_type, "complete", method)
     else:
         # Both fallback methods failed
         logging.error(f"[Worker] Both fallback methods failed. Marking video_id={video_id} as failed.")
-        value_cache.set(status_key, "failed")
+        value_cache.set(status_key, "failed", ex=STATUS_EXPIRATION)
+        publish_job_event(video_id, task_type, "failed")
 
-def main_loop():
-    logging.info("Worker started. Listening for tasks...")
-    SLEEP_TIME = 5 * 60  # 5 minutes
-    while True:
-        # Keep heartbeat alive
-        value_cache.setex(WORKER_HEARTBEAT, SLEEP_TIME, "alive")
+def lane_order(consecutive_fast_jobs: int) -> list:
+    """
+    Lanes in the order they should be checked. The fast lane is drained first, but
+    after FAST_LANE_BURST fast jobs in a row the slow lane goes first once so Whisper
+    jobs aren't starved. Background jobs only run when both are empty.
+    """
+    if consecutive_fast_jobs >= FAST_LANE_BURST:
+        return [SLOW_LANE, FAST_LANE, BACKGROUND_LANE]
+    return [FAST_LANE, SLOW_LANE, BACKGROUND_LANE]
 
-        # BLPOP blocks until there's a job
-        logging.info(f"Waiting for new jobs at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        result = value_cache.blpop([QUEUE_NAME], timeout=SLEEP_TIME)
-        if not result:
-            continue
+def hold_jobs(jobs: list) -> list:
+    with held_jobs_lock:
+        for job in jobs:
+            held_jobs[job.entry_id] = (job, time.time())
+    if jobs:
+        advertise()
+    return jobs
 
-        _, raw_data = result
-        try:
-            job_data = json.loads(raw_data)
-            video_id = job_data["video_id"]
-            task_type = job_data["task_type"]
-            logging.info(f"Picked up job: {video_id}, task_type={task_type}")
-            start_time = time.time()
+def release_job(job: Job):
+    with held_jobs_lock:
+        held_jobs.pop(job.entry_id, None)
+    advertise()
 
-            process_job(video_id, task_type)
+def advertise():
+    """
+    Refreshes this worker's registry entry so free slots show up as soon as they change.
+    """
+    try:
+        advertise_worker(WORKER_ID, JOB_SLOTS, ADVERTISED_SLOTS, len(held_jobs))
+    except Exception as e:
+        logging.warning(f"[Worker] Could not update the worker registry: {e}")
 
-            logging.info(f"Job completed in {time.time() - start_time:.2f}s for video_id={video_id}")
+def heartbeat_loop():
+    """
+    Keeps this worker's registry entry and the leases of held jobs alive, and
+    periodically requeues jobs whose leases expired (e.g. another worker crashed
+    mid-job) and prunes dead workers.
+    """
+    last_reap = 0.0
+    while True:
+        try:
+            advertise_worker(WORKER_ID, JOB_SLOTS, ADVERTISED_SLOTS, len(held_jobs))
 
+            now = time.time()
+            with held_jobs_lock:
+                jobs = [job for job, claimed_at in held_jobs.values() if now - claimed_at < MAX_JOB_TIME]
+            if jobs:
+                renew_leases(WORKER_ID, jobs)
+
+            if now - last_reap >= REAP_INTERVAL:
+                last_reap = now
+                requeued = requeue_expired_leases(WORKER_ID)
+                if requeued:
+                    logging.warning(f"[Worker] Reaper handled {requeued} expired lease(s)")
+                dead = prune_workers()
+                if dead:
+                    logging.warning(f"[Worker] Removed dead worker(s) from the registry: {dead}")
         except Exception as e:
-            logging.exception(f"Error decoding job data or processing job: {raw_data}, {e}")
+            logging.exception(f"[Worker] Heartbeat failed: {e}")
+        time.sleep(HEARTBEAT_INTERVAL)
+
+def start_heartbeat():
+    global heartbeat_thread
+    if heartbeat_thread is None or not heartbeat_thread.is_alive():
+        heartbeat_thread = threading.Thread(target=heartbeat_loop, name="heartbeat", daemon=True)
+        heartbeat_thread.start()
+
+def run_job(job: Job):
+    """
+    Processes a leased job and acknowledges it. If processing raises, the lease is
+    dropped without an ack so the reaper requeues the job once it expires.
+    """
+    video_id = job.video_id
+    task_type = job.task_type
+    logging.info(f"Picked up job from {job.lane}: {video_id}, task_type={task_type}")
+    start_time = time.time()
+    timings = job_timings(job, start_time)
+    try:
+        remaining = process_job(video_id, task_type, job.payload.get("methods"), fast_lane=(job.lane == FAST_LANE), timings=timings)
+        finish_job(job, remaining, start_time, timings)
+    except Exception as e:
+        logging.exception(f"Error processing job: {job}, {e}")
+    finally:
+        release_job(job)
+
+def job_timings(job: Job, start_time: float) -> StageTimings:
+    """
+    Starts the stage timings of a job with the time it waited in its lane.
+    """
+    timings = StageTimings()
+    enqueued_at = job.payload.get("enqueued_at")
+    if enqueued_at:
+        timings.add("queue_wait", start_time - enqueued_at)
+    return timings
+
+def finish_job(job: Job, remaining: Optional[list], start_time: float, timings: Optional[StageTimings] = None):
+    """
+    Acknowledges a processed job, or moves it to the slow lane if it stopped early with
+    methods remaining, and records its duration for admission estimates and its stage
+    timings for the metrics.
+    """
+    elapsed = time.time() - start_time
+    video_seconds = job.payload.get("video_seconds")
+    if remaining:
+        estimate = round(estimate_job_seconds(SLOW_LANE, video_seconds), 1)
+        # Restarts the clock so each lane's wait is measured on its own
+        requeue_job(job, SLOW_LANE, methods=remaining, estimate=estimate, enqueued_at=time.time())
+    else:
+        ack_job(job)
+    logging.info(f"Job completed in {elapsed:.2f}s for video_id={job.video_id}")
+
+    # Feeds the admission estimates in get_transcript
+    record_job_duration(job.lane, elapsed, video_seconds)
+    if timings:
+        record_stage_timings(timings, job.task_type)
+
+class JobRun:
+    """
+    A leased job moving through the staged pipeline.
+    """
+    def __init__(self, job: Job):
+        self.job = job
+        self.methods = list(job.payload.get("methods") or get_fallback_order(job.task_type))
+        self.transcript = None
+        self.method_used = None
+        self.remaining = None  # methods handed over to the slow lane
+        self.audio = None
+        self.start_time = time.time()
+        self.timings = job_timings(job, self.start_time)
+
+    def __repr__(self):
+        return f"JobRun({self.job.video_id}, methods={self.methods})"
+
+def route_run(run: JobRun) -> str:
+    """
+    Picks the next stage for a job: the stage for its next method, or store once it has
+    a transcript or has run out of methods. Mirrors process_job's fallback order,
+    including handing Whisper work from the fast lane over to the slow lane.
+    """
+    if run.transcript or not run.methods:
+        return "store"
+    if run.methods[0] == "audio" and run.job.lane == FAST_LANE:
+        run.remaining = list(run.methods)
+        return "store"
+
+    method = run.methods.pop(0)
+    logging.info(f"[Worker] Attempting method '{method}' for video_id={run.job.video_id}")
+    return "captions" if method == "youtube" else "download"
+
+def captions_stage(run: JobRun) -> str:
+    with run.timings.time("captions"):
+        transcript = get_youtube_str_transcript(run.job.video_id)
+    if transcript:
+        run.transcript, run.method_used = transcript, "youtube"
+    else:
+        logging.warning(f"[Worker] Method 'youtube' failed or returned no transcript for video_id={run.job.video_id}")
+    return route_run(run)
+
+def download_stage(run: JobRun) -> str:
+    try:
+        run.audio = download_audio(run.job.video_id, timings=run.timings)
+        return "transcribe"
+    except Exception as e:
+        logging.exception(f"[Worker] Download failed for video={run.job.video_id}: {e}")
+        return route_run(run)
+
+def transcribe_stage(run: JobRun) -> str:
+    try:
+        on_segment = partial_transcript_publisher(run.job.video_id, run.job.task_type)
+        run.transcript, run.method_used = transcribe_audio(run.audio, on_segment=on_segment, timings=run.timings), "audio"
+    except Exception as e:
+        logging.exception(f"[Worker] Exception using method 'audio' for video={run.job.video_id}: {e}")
+    finally:
+        release_audio(run.audio)
+        run.audio = None
+    return route_run(run)
+
+def store_stage(run: JobRun) -> None:
+    job = run.job
+    try:
+        if run.remaining:
+            logging.info(f"[Worker] Moving video_id={job.video_id} to the slow lane for methods {run.remaining}")
+            value_cache.set(get_status_key(job.task_type, job.video_id), "queued", ex=STATUS_EXPIRATION)
+        else:
+            run.timings.method = run.method_used
+            with run.timings.time("store"):
+                store_job_result(job.video_id, job.task_type, run.transcript, run.method_used)
+        finish_job(job, run.remaining, run.start_time, run.timings)
+    except Exception as e:
+        # Not acknowledged, so the reaper requeues the job once its lease expires
+        logging.exception(f"Error storing job: {job}, {e}")
+    finally:
+        release_job(job)
+        job_slots.release()
+    return None
+
+def on_stage_error(stage_name: str, run: JobRun, error: Exception) -> Optional[str]:
+    # store_stage handles its own errors; anything else falls through to the next method
+    return None if stage_name == "store" else route_run(run)
+
+def start_staged_pipeline():
+    global staged_pipeline
+    if staged_pipeline is None:
+        staged_pipeline = StagedPipeline(
+            {
+                "captions": (captions_stage, STAGE_WORKERS["captions"]),
+                "download": (download_stage, STAGE_WORKERS["download"]),
+                "transcribe": (transcribe_stage, STAGE_WORKERS["transcribe"]),
+                "store": (store_stage, STAGE_WORKERS["store"]),
+            },
+            queue_size=STAGED_MAX_IN_FLIGHT,
+            on_error=on_stage_error
+        )
+        staged_pipeline.start()
+
+def dispatch_job(job: Job):
+    """
+    Hands a claimed job to the pool or the staged pipeline. The caller holds a job slot,
+    which is released once the job is finished.
+    """
+    # A user may have asked for the video since it was queued in the background
+    if job.lane == BACKGROUND_LANE and is_cached_or_queued(job.video_id, job.task_type):
+        logging.info(f"Skipping background job for video_id={job.video_id}, already cached or queued")
+        ack_job(job)
+        release_job(job)
+        job_slots.release()
+        return
+
+    if WORKER_MODE == "staged":
+        logging.info(f"Picked up job from {job.lane}: {job.video_id}, task_type={job.task_type}")
+        value_cache.set(get_status_key(job.task_type, job.video_id), "in_progress", ex=STATUS_EXPIRATION)
+        run = JobRun(job)
+        staged_pipeline.submit(route_run(run), run)
+    else:
+        job_executor.submit(run_job, job).add_done_callback(lambda _: job_slots.release())
+
+def main_loop():
+    """
+    Claims jobs and runs up to JOB_SLOTS of them at once, either on the job pool or
+    through the staged pipeline. A slot is taken before claiming, so the worker never
+    leases more jobs than it can start (apart from the extra jobs a multi-lane blocking
+    read can return).
+    """
+    logging.info(f"Worker {WORKER_ID} started in {WORKER_MODE} mode with {JOB_SLOTS} job slot(s). Listening for tasks...")
+    ensure_consumer_groups()
+    migrate_legacy_queues()
+    start_heartbeat()
+    if WORKER_MODE == "staged":
+        start_staged_pipeline()
+
+    consecutive_fast_jobs = 0
+    backlog = deque()
+    try:
+        while True:
+            job_slots.acquire()
+            try:
+                while not backlog:
+                    # Blocks until there's a job, taking it from the first non-empty lane
+                    logging.info(f"Waiting for new jobs at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                    backlog.extend(hold_jobs(claim_jobs(WORKER_ID, lane_order(consecutive_fast_jobs), CLAIM_BLOCK_MS)))
+
+                job = backlog.popleft()
+                consecutive_fast_jobs = consecutive_fast_jobs + 1 if job.lane == FAST_LANE else 0
+                dispatch_job(job)
+            except BaseException:
+                job_slots.release()
+                raise
+    finally:
+        # Hand back anything claimed but not started rather than waiting for the reaper
+        for job in backlog:
+            try:
+                requeue_job(job)
+            except Exception as e:
+                logging.exception(f"Could not requeue {job}, leaving it to the reaper: {e}")
+            release_job(job)
 
 def run_worker():
-    while True:
+    if blocking_ms(CLAIM_BLOCK_MS) < CLAIM_BLOCK_MS:
+        logging.warning(
+            f"[Worker] CLAIM_BLOCK_MS ({CLAIM_BLOCK_MS}) is too close to the Redis socket timeout ({REDIS_SOCKET_TIMEOUT}s), "
+            f"claims will block for {blocking_ms(CLAIM_BLOCK_MS)}ms"
+        )
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if WATCH_CHANNELS:
+        start_channel_watcher(WATCH_CHANNELS, WATCH_METHODS)
+    try:
+        while True:
+            try:
+                main_loop()
+            except Exception as e:
+                logging.exception(f"Worker loop crashed. Restarting in 1sec... {e}")
+                time.sleep(1)
+    finally:
+        # Leave the registry on shutdown so the fleet's capacity drops right away
         try:
-            main_loop()
+            deregister_worker(WORKER_ID)
         except Exception as e:
-            logging.exception(f"Worker loop crashed. Restarting in 1sec... {e}")
-            time.sleep(1)
+            logging.warning(f"[Worker] Could not deregister {WORKER_ID}: {e}")
 
 if __name__ == "__main__":
     run_worker()
@@ -0,0 +1,455 @@
+# job_queue.py
+#
+# Transcript jobs live in Redis Streams (one per lane) read through a single consumer
+# group. A job that has been delivered but not acknowledged sits in the group's
+# pending entries list: that is its lease. The worker renews leases with heartbeats,
+# and any job whose lease goes stale (the worker died or hung) is requeued by the reaper.
+
+import json
+import logging
+import time
+from statistics import median
+from typing import List, Optional
+
+import redis
+
+from redis_wrapper import (
+    value_cache,
+    FAST_LANE,
+    SLOW_LANE,
+    BACKGROUND_LANE,
+    JOB_GROUP,
+    LEGACY_QUEUES,
+    WORKER_REGISTRY,
+    WORKER_TTL,
+    blocking_ms,
+    live_workers,
+    queue_for_task,
+    server_time,
+    transcript_events_channel
+)
+
+LANES = [FAST_LANE, SLOW_LANE, BACKGROUND_LANE]
+JOB_STATS_SAMPLES = 50     # recent job durations kept per lane for admission estimates
+# Estimate per lane before any durations are recorded: (fixed seconds, seconds per second of video)
+DEFAULT_ESTIMATES = {
+    FAST_LANE: (5.0, 0.0),
+    SLOW_LANE: (15.0, 0.02),
+}
+LEASE_TIMEOUT = 120        # seconds without a heartbeat before a job is requeued
+MAX_ATTEMPTS = 3           # deliveries before a job that keeps losing its lease is marked failed
+STATUS_EXPIRATION = 60 * 60
+
+class Job:
+    """
+    A job claimed from one of the lanes. entry_id identifies its lease.
+    """
+    def __init__(self, lane: str, entry_id: str, payload: dict):
+        self.lane = lane
+        self.entry_id = entry_id
+        self.payload = payload
+
+    @property
+    def video_id(self) -> str:
+        return self.payload["video_id"]
+
+    @property
+    def task_type(self) -> str:
+        return self.payload["task_type"]
+
+    def __repr__(self):
+        return f"Job({self.lane}, {self.entry_id}, {self.payload})"
+
+# Dedupe, admission check, status transition and push done as one atomic step. A job is
+# a duplicate if its task type already has one queued or in progress, or if a job for the
+# same video in the lane (queued or leased, of any task type) will start with the same
+# method, e.g. a caption job that fell back to Whisper and a new audio request.
+# KEYS: status key, lane stream, audio transcript key, youtube transcript key
+# ARGV: job payload (JSON, with an 'estimate' in seconds), hard cap on jobs in the lane,
+#       status expiration, client deadline in seconds, job slots draining the lane,
+#       estimate to assume for queued jobs that don't carry one
+# Returns {outcome, position, eta, task type}. position is 1-based and counts the jobs in
+# progress. The task type is that of the job the caller should watch: the matched job's
+# for a duplicate of another task type (its status key is the one that will change),
+# otherwise the caller's own.
+# eta is the projected seconds until the job completes: the work ahead of it spread over
+# the job slots, plus its own estimate. A job is only admitted if it would complete
+# within the deadline, which callers scale with the video's length.
+ENQUEUE_SCRIPT = """
+local job = cjson.decode(ARGV[1])
+if redis.call('EXISTS', KEYS[3]) == 1 or redis.call('EXISTS', KEYS[4]) == 1 then
+    return {'cached', 0, 0, job['task_type']}
+end
+
+-- The method a job runs first, as the worker's get_fallback_order picks it
+local function first_method(payload)
+    if type(payload['methods']) == 'table' and payload['methods'][1] then
+        return payload['methods'][1]
+    end
+    if payload['task_type'] == 'audio' then
+        return 'audio'
+    end
+    return 'youtube'
+end
+
+local own_method = first_method(job)
+local slots = math.max(tonumber(ARGV[5]), 1)
+local own_estimate = tonumber(job['estimate']) or tonumber(ARGV[6])
+local status = redis.call('GET', KEYS[1])
+local is_duplicate = status == 'queued' or status == 'in_progress'
+
+local entries = redis.call('XRANGE', KEYS[2], '-', '+')
+local ahead = 0
+for i, entry in ipairs(entries) do
+    local ok, queued = pcall(cjson.decode, entry[2][2])
+    local estimate = (ok and tonumber(queued['estimate'])) or tonumber(ARGV[6])
+    if ok and queued['video_id'] == job['video_id'] and (is_duplicate or first_method(queued) == own_method) then
+        local watched = is_duplicate and job['task_type'] or queued['task_type']
+        return {'duplicate', i, math.ceil(ahead / slots + estimate), watched}
+    end
+    ahead = ahead + estimate
+end
+
+local wait = math.ceil(ahead / slots)
+local eta = wait + math.ceil(own_estimate)
+if is_duplicate then
+    return {'duplicate', 0, eta, job['task_type']}
+end
+if #entries >= tonumber(ARGV[2]) then
+    return {'full', #entries, eta, job['task_type']}
+end
+if eta > tonumber(ARGV[4]) then
+    return {'late', #entries + 1, eta, job['task_type']}
+end
+
+redis.call('SET', KEYS[1], 'queued', 'EX', ARGV[3])
+redis.call('XADD', KEYS[2], '*', 'job', ARGV[1])
+return {'queued', #entries + 1, eta, job['task_type']}
+"""
+enqueue_script = value_cache.register_script(ENQUEUE_SCRIPT)
+
+# Writes a worker's registry entry stamped with the Redis server's clock, so heartbeats
+# can be compared across hosts whose clocks disagree (effects are replicated rather than
+# the script, as TIME needs on Redis versions before 5).
+# KEYS[1]: worker registry hash
+# ARGV: worker ID, registry entry (JSON, without its heartbeat)
+ADVERTISE_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local info = cjson.decode(ARGV[2])
+info['heartbeat'] = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(info))
+return 1
+"""
+advertise_script = value_cache.register_script(ADVERTISE_SCRIPT)
+
+PARTIAL_EXPIRATION = 60 * 60
+
+def partial_transcript_key(video_id: str) -> str:
+    """
+    Stream of transcript segments appended while a long video is still being transcribed.
+    """
+    return f"transcript_partial:{video_id}"
+
+def status_key(task_type: str, video_id: str) -> str:
+    return f"transcript_status:{task_type}:{video_id}"
+
+def transcript_key(method: str, video_id: str) -> str:
+    return f"transcript:{method}:{video_id}"
+
+def ensure_consumer_groups():
+    """
+    Creates the consumer group on every lane, creating the streams if needed.
+    """
+    for lane in LANES:
+        try:
+            value_cache.xgroup_create(lane, JOB_GROUP, id="0", mkstream=True)
+            logging.info(f"[Queue] Created consumer group {JOB_GROUP} on {lane}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+def enqueue_job(payload: dict, lane: Optional[str] = None, client=None):
+    """
+    Appends a job to its lane. Pass a pipeline as client to batch several enqueues.
+    """
+    client = client if client is not None else value_cache
+    lane = lane or queue_for_task(payload["task_type"])
+    client.xadd(lane, {"job": json.dumps(payload)})
+
+def enqueue_unique_job(payload: dict, max_jobs: int, deadline: float, default_estimate: float, slots: int = 1, client=None):
+    """
+    Atomically enqueues a job unless the video already has a transcript, the same job
+    (or another job for the video that will run the same method) is already queued or
+    in progress, the lane is at its hard cap, or the job wouldn't complete before the
+    deadline: the jobs queued ahead of it plus its own estimate. Pass a pipeline as
+    client to batch several enqueues; the results then come back from the pipeline's
+    execute().
+
+    :param payload: The job. Its 'estimate' (seconds) feeds the admission check.
+    :param max_jobs: Hard cap on queued or in progress jobs in the lane.
+    :param deadline: Seconds the caller is willing to wait for the job to complete.
+    :param default_estimate: Seconds to assume for queued jobs that carry no estimate.
+    :param slots: Number of jobs the workers can run at once.
+    :return: [outcome, position, eta, task_type]. outcome is 'queued', 'duplicate',
+             'cached', 'full' or 'late'. position is the job's 1-based place in its lane
+             (0 if unknown, the lane depth for 'full'). eta is the projected seconds to
+             completion. task_type is the task type whose status key tracks the job: the
+             matched job's when it's a duplicate of another task type, else the payload's.
+    """
+    video_id = payload["video_id"]
+    keys = [
+        status_key(payload["task_type"], video_id),
+        queue_for_task(payload["task_type"]),
+        transcript_key("audio", video_id),
+        transcript_key("youtube", video_id),
+    ]
+    args = [json.dumps(payload), max_jobs, STATUS_EXPIRATION, deadline, slots, default_estimate]
+    return enqueue_script(keys=keys, args=args, client=client if client is not None else value_cache)
+
+def job_stats_key(lane: str) -> str:
+    return f"job_stats:{lane}"
+
+def record_job_duration(lane: str, seconds: float, video_seconds: Optional[float] = None):
+    """
+    Records how long a job took on a lane, keeping the last JOB_STATS_SAMPLES samples.
+    """
+    sample = {"seconds": round(seconds, 2), "video_seconds": video_seconds}
+    pipe = value_cache.pipeline(transaction=False)
+    pipe.lpush(job_stats_key(lane), json.dumps(sample))
+    pipe.ltrim(job_stats_key(lane), 0, JOB_STATS_SAMPLES - 1)
+    pipe.execute()
+
+def load_job_stats(lane: str) -> List[dict]:
+    return parse_job_stats(value_cache.lrange(job_stats_key(lane), 0, -1))
+
+def parse_job_stats(raw_samples: List[str]) -> List[dict]:
+    samples = []
+    for raw_sample in raw_samples:
+        try:
+            samples.append(json.loads(raw_sample))
+        except ValueError:
+            continue
+    return samples
+
+def estimate_job_seconds(lane: str, video_seconds: Optional[float] = None, samples: Optional[List[dict]] = None) -> float:
+    """
+    Estimates how long a job on the lane will take from recently recorded durations.
+    When the video duration is known, it's scaled by the median processing time per
+    second of video, otherwise the median job time is used.
+
+    :param samples: Samples from load_job_stats, to avoid re-reading them per job.
+    """
+    samples = load_job_stats(lane) if samples is None else samples
+    scaled = [s["seconds"] / s["video_seconds"] for s in samples if s.get("video_seconds")]
+    if video_seconds and scaled:
+        return median(scaled) * video_seconds
+    if samples and not video_seconds:
+        return median(s["seconds"] for s in samples)
+
+    fixed, per_video_second = DEFAULT_ESTIMATES.get(lane, DEFAULT_ESTIMATES[SLOW_LANE])
+    return fixed + per_video_second * (video_seconds or 0)
+
+def _to_jobs(response) -> List[Job]:
+    jobs = []
+    for lane, entries in response or []:
+        for entry_id, fields in entries:
+            try:
+                jobs.append(Job(lane, entry_id, json.loads(fields["job"])))
+            except Exception as e:
+                # Nothing can process a malformed entry, so drop it rather than let it be requeued forever
+                logging.exception(f"[Queue] Dropping malformed job {entry_id} on {lane}: {fields}, {e}")
+                ack_job(Job(lane, entry_id, {}))
+    return jobs
+
+def claim_jobs(consumer: str, lanes: List[str], block_ms: int) -> List[Job]:
+    """
+    Leases the next job, checking lanes in priority order. If every lane is empty,
+    blocks for up to block_ms on all of them at once (less if that would reach the Redis
+    socket timeout); that read can return one job per lane, so the caller gets a list
+    and holds the leases for every job in it.
+    """
+    for lane in lanes:
+        jobs = _to_jobs(value_cache.xreadgroup(JOB_GROUP, consumer, {lane: ">"}, count=1))
+        if jobs:
+            return jobs
+
+    response = value_cache.xreadgroup(JOB_GROUP, consumer, {lane: ">" for lane in lanes}, count=1, block=blocking_ms(block_ms))
+    jobs = _to_jobs(response)
+    jobs.sort(key=lambda job: lanes.index(job.lane))
+    return jobs
+
+def renew_leases(consumer: str, jobs: List[Job]):
+    """
+    Heartbeat: re-claiming our own pending entries resets their idle time.
+    """
+    pipe = value_cache.pipeline(transaction=False)
+    for job in jobs:
+        pipe.xclaim(job.lane, JOB_GROUP, consumer, min_idle_time=0, message_ids=[job.entry_id], justid=True)
+    pipe.execute()
+
+def ack_job(job: Job):
+    """
+    Releases a finished job for good. Acknowledged entries are deleted so that the
+    stream length stays equal to the number of queued or in progress jobs.
+    """
+    pipe = value_cache.pipeline(transaction=True)
+    pipe.xack(job.lane, JOB_GROUP, job.entry_id)
+    pipe.xdel(job.lane, job.entry_id)
+    pipe.execute()
+
+def requeue_job(job: Job, lane: Optional[str] = None, **changes):
+    """
+    Puts a leased job back at the end of a lane (its own by default) and releases the lease.
+    """
+    payload = dict(job.payload, **changes)
+    pipe = value_cache.pipeline(transaction=True)
+    enqueue_job(payload, lane or job.lane, client=pipe)
+    pipe.xack(job.lane, JOB_GROUP, job.entry_id)
+    pipe.xdel(job.lane, job.entry_id)
+    pipe.execute()
+
+def publish_job_event(video_id: str, task_type: str, status: str, method: Optional[str] = None):
+    """
+    Notify anyone waiting in get_transcript that the job finished. This is best effort:
+    waiters re-check the transcript keys on every event and still poll if pub/sub is down.
+    """
+    event = {
+        "video_id": video_id,
+        "task_type": task_type,
+        "status": status,
+        "method": method
+    }
+    try:
+        receivers = value_cache.publish(transcript_events_channel(video_id), json.dumps(event))
+        logging.info(f"[Queue] Published '{status}' event for video_id={video_id} to {receivers} waiter(s)")
+    except Exception as e:
+        logging.warning(f"[Queue] Could not publish '{status}' event for video_id={video_id}: {e}")
+
+def reset_partial_transcript(video_id: str):
+    """
+    Drops segments left over from an earlier attempt before a new transcription starts,
+    and marks the start of the new attempt so readers drop the text they already have.
+    """
+    key = partial_transcript_key(video_id)
+    pipe = value_cache.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.xadd(key, {"attempt": str(time.time())})
+    pipe.expire(key, PARTIAL_EXPIRATION)
+    pipe.execute()
+
+def append_partial_transcript(video_id: str, task_type: str, text: str):
+    """
+    Appends a finished segment to the video's partial transcript stream and wakes waiters.
+    """
+    key = partial_transcript_key(video_id)
+    pipe = value_cache.pipeline(transaction=False)
+    pipe.xadd(key, {"text": text})
+    pipe.expire(key, PARTIAL_EXPIRATION)
+    pipe.execute()
+    publish_job_event(video_id, task_type, "partial", "audio")
+
+def requeue_expired_leases(consumer: str, lease_timeout: float = LEASE_TIMEOUT) -> int:
+    """
+    Reaper: takes over every job whose lease hasn't been renewed for lease_timeout
+    seconds and puts it back in its lane. Jobs that have already used MAX_ATTEMPTS
+    deliveries are marked failed instead so a job that crashes workers can't loop forever.
+
+    :return: Number of expired leases handled.
+    """
+    handled = 0
+    for lane in LANES:
+        start_id = "0-0"
+        while True:
+            response = value_cache.xautoclaim(lane, JOB_GROUP, consumer, min_idle_time=int(lease_timeout * 1000), start_id=start_id, count=50)
+            start_id, entries = response[0], response[1]
+            for entry_id, fields in entries:
+                handled += 1
+                if not fields:
+                    # Entry was deleted while pending, only the lease is left
+                    value_cache.xack(lane, JOB_GROUP, entry_id)
+                    continue
+                try:
+                    job = Job(lane, entry_id, json.loads(fields["job"]))
+                except Exception as e:
+                    logging.exception(f"[Queue] Dropping malformed expired job {entry_id} on {lane}: {fields}, {e}")
+                    ack_job(Job(lane, entry_id, {}))
+                    continue
+
+                attempts = job.payload.get("attempts", 1)
+                if attempts >= MAX_ATTEMPTS:
+                    logging.error(f"[Queue] Lease expired for {job} after {attempts} attempts. Marking as failed.")
+                    ack_job(job)
+                    value_cache.set(status_key(job.task_type, job.video_id), "failed", ex=STATUS_EXPIRATION)
+                    publish_job_event(job.video_id, job.task_type, "failed")
+                else:
+                    logging.warning(f"[Queue] Lease expired for {job}. Requeueing (attempt {attempts + 1}).")
+                    value_cache.set(status_key(job.task_type, job.video_id), "queued", ex=STATUS_EXPIRATION)
+                    requeue_job(job, attempts=attempts + 1)
+            if start_id == "0-0":
+                break
+    return handled
+
+def advertise_worker(worker_id: str, slots: int, capacity: int, busy: int):
+    """
+    Registers the worker, or refreshes its entry, in the worker registry. Doubles as the
+    worker's heartbeat, stamped with the Redis server's time.
+
+    :param slots: Jobs the worker can hold at once.
+    :param capacity: Jobs it works through in parallel, used for queue ETAs.
+    :param busy: Jobs it currently holds.
+    """
+    info = {"slots": slots, "capacity": capacity, "busy": busy}
+    advertise_script(keys=[WORKER_REGISTRY], args=[worker_id, json.dumps(info)])
+
+def deregister_worker(worker_id: str):
+    value_cache.hdel(WORKER_REGISTRY, worker_id)
+
+def prune_workers() -> List[str]:
+    """
+    Removes registry entries of workers that stopped sending heartbeats, and consumers
+    with no pending jobs that have been idle for as long. A dead worker's leases are
+    taken over by the reaper first, so its consumer is only removed once it holds nothing.
+    A live worker that is removed just gets re-created on its next read.
+
+    :return: IDs of the workers removed from the registry.
+    """
+    pipe = value_cache.pipeline(transaction=False)
+    pipe.time()
+    pipe.hgetall(WORKER_REGISTRY)
+    now, registry = pipe.execute()
+    live = live_workers(registry, server_time(now))
+    dead = [worker_id for worker_id in registry if worker_id not in live]
+    if dead:
+        value_cache.hdel(WORKER_REGISTRY, *dead)
+
+    for lane in LANES:
+        try:
+            consumers = value_cache.xinfo_consumers(lane, JOB_GROUP)
+        except redis.ResponseError:
+            continue
+        for consumer in consumers:
+            if consumer["pending"] == 0 and consumer["idle"] >= WORKER_TTL * 1000 and consumer["name"] not in live:
+                value_cache.xgroup_delconsumer(lane, JOB_GROUP, consumer["name"])
+    return dead
+
+def migrate_legacy_queues() -> int:
+    """
+    Moves jobs left in the old list-based queues into the job streams.
+    """
+    moved = 0
+    for queue_name in LEGACY_QUEUES:
+        while True:
+            raw_data = value_cache.lpop(queue_name)
+            if raw_data is None:
+                break
+            try:
+                payload = json.loads(raw_data)
+                lane = SLOW_LANE if payload.get("methods") else queue_for_task(payload["task_type"])
+                enqueue_job(payload, lane)
+                moved += 1
+            except Exception as e:
+                logging.exception(f"[Queue] Dropping malformed legacy job from {queue_name}: {raw_data}, {e}")
+    if moved:
+        logging.info(f"[Queue] Migrated {moved} job(s) from legacy list queues")
+    return moved
@@ -0,0 +1,244 @@
+# metrics.py
+#
+# Per-stage timing histograms for the transcript worker, kept in Redis so every worker
+# adds to the same series. Each series is a hash of bucket counts plus a count and a
+# sum, tagged by stage, task type and the method that produced the transcript, and can
+# be rendered in the Prometheus text format or summarised as percentiles.
+#
+# Usage:
+#     python metrics.py              # p50/p95/p99 per stage
+#     python metrics.py --prometheus # Prometheus text exposition
+#     python metrics.py --compression # how much the Redis value codec saves
+#     python metrics.py --cache      # hits, lock waits and compute time per cached function
+
+import argparse
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from redis_wrapper import value_cache, get_cache_stats, measure_compression
+
+STAGES = ["queue_wait", "captions", "download", "transcode", "transcription", "store"]
+# Upper bounds in seconds, from a caption fetch up to a long Whisper job
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800]
+METRICS_PREFIX = "metrics:stage_seconds"
+METRICS_SERIES = "metrics:series"  # set of every series key, so export doesn't need SCAN
+METRIC_NAME = "transcript_stage_seconds"
+
+class StageTimings:
+    """
+    Time spent in each stage of one job. Stages can be timed from any thread and
+    repeat stages (e.g. several transcription calls) add up. The method is set once the
+    job knows which method produced its transcript.
+    """
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.method = None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] += max(seconds, 0.0)
+
+    @contextmanager
+    def time(self, stage: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start_time)
+
+@contextmanager
+def time_stage(timings: Optional[StageTimings], stage: str):
+    """
+    Times a block into timings, or does nothing if timings is None.
+    """
+    if timings is None:
+        yield
+        return
+    with timings.time(stage):
+        yield
+
+def series_key(stage: str, task_type: str, method: Optional[str]) -> str:
+    return f"{METRICS_PREFIX}:{stage}:{task_type}:{method or 'none'}"
+
+def bucket_field(seconds: float) -> str:
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return str(bound)
+    return "+Inf"
+
+def record_stage_timings(timings: StageTimings, task_type: str, client=None):
+    """
+    Adds every stage of a finished job to its histogram, in one round trip.
+    """
+    if not timings.seconds:
+        return
+    pipe = (client or value_cache).pipeline(transaction=False)
+    with timings._lock:
+        stages = dict(timings.seconds)
+    for stage, seconds in stages.items():
+        key = series_key(stage, task_type, timings.method)
+        pipe.sadd(METRICS_SERIES, key)
+        pipe.hincrby(key, bucket_field(seconds), 1)
+        pipe.hincrby(key, "count", 1)
+        pipe.hincrbyfloat(key, "sum", seconds)
+    try:
+        pipe.execute()
+    except Exception as e:
+        # Metrics are best effort and must never fail a job
+        logging.warning(f"[Metrics] Could not record stage timings for {task_type}: {e}")
+
+def load_histograms(client=None) -> Dict[Tuple[str, str, str], dict]:
+    """
+    :return: Dict of (stage, task_type, method) to {"buckets": [(bound, cumulative count)],
+             "count": int, "sum": float}, with +Inf as the last bucket.
+    """
+    client = client or value_cache
+    keys = sorted(client.smembers(METRICS_SERIES))
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+
+    histograms = {}
+    for key, fields in zip(keys, pipe.execute()):
+        if not fields:
+            continue
+        stage, task_type, method = key[len(METRICS_PREFIX) + 1:].split(":", 2)
+        cumulative, buckets = 0, []
+        for bound in BUCKETS + ["+Inf"]:
+            cumulative += int(fields.get(str(bound), 0))
+            buckets.append((bound, cumulative))
+        histograms[(stage, task_type, method)] = {
+            "buckets": buckets,
+            "count": int(fields.get("count", 0)),
+            "sum": float(fields.get("sum", 0.0)),
+        }
+    return histograms
+
+def estimate_quantile(buckets: List[Tuple[object, int]], quantile: float) -> Optional[float]:
+    """
+    Estimates a quantile from cumulative bucket counts by interpolating linearly within
+    the bucket it falls in, like Prometheus' histogram_quantile.
+    """
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    rank = quantile * total
+    lower_bound, lower_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == "+Inf":
+                # Nothing to interpolate towards, the highest finite bound is a lower bound
+                return float(BUCKETS[-1])
+            if count == lower_count:
+                return float(bound)
+            return lower_bound + (float(bound) - lower_bound) * (rank - lower_count) / (count - lower_count)
+        if bound != "+Inf":
+            lower_bound, lower_count = float(bound), count
+    return float(BUCKETS[-1])
+
+def render_prometheus(client=None) -> str:
+    """
+    All stage histograms in the Prometheus text exposition format.
+    """
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in each stage of a transcript job.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for (stage, task_type, method), histogram in sorted(load_histograms(client).items()):
+        labels = f'stage="{stage}",task_type="{task_type}",method="{method}"'
+        for bound, count in histogram["buckets"]:
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram['sum']:.6f}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+def render_summary(client=None) -> str:
+    """
+    A table of count, mean and estimated p50/p95/p99 per series, stages in pipeline order.
+    """
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    rows = [f"{'stage':<14} {'task_type':<9} {'method':<8} {'count':>7} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8}"]
+    histograms = load_histograms(client)
+    for (stage, task_type, method) in sorted(histograms, key=lambda k: (k[1], k[2], order.get(k[0], len(order)))):
+        histogram = histograms[(stage, task_type, method)]
+        count = histogram["count"]
+        quantiles = [estimate_quantile(histogram["buckets"], q) for q in (0.5, 0.95, 0.99)]
+        rows.append(
+            f"{stage:<14} {task_type:<9} {method:<8} {count:>7} {histogram['sum'] / max(count, 1):>8.2f} "
+            + " ".join(f"{q:>8.2f}" if q is not None else f"{'-':>8}" for q in quantiles)
+        )
+    return "\n".join(rows)
+
+def render_cache_summary() -> str:
+    """
+    A table of the cache decorators' counters per function, most computed first.
+    """
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+
+    rows = [
+        f"{'function':<28} {'calls':>7} {'hit rate':>8} {'computes':>8} {'mean s':>9} "
+        f"{'lock waits':>10} {'wait s':>9} {'lock fails':>10} {'errors':>6} {'mean KB':>8}"
+    ]
+    stats = get_cache_stats()
+    for name in sorted(stats, key=lambda n: -stats[n]["compute_seconds"]):
+        s = stats[name]
+        calls = int(s["local_hits"] + s["hits"] + s["misses"])
+        hit_rate = f"{s['hit_rate']:>8.0%}" if s["hit_rate"] is not None else f"{'-':>8}"
+        size = f"{s['mean_stored_bytes'] / 1024:>8.1f}" if s["mean_stored_bytes"] is not None else f"{'-':>8}"
+        rows.append(
+            f"{name:<28} {calls:>7} {hit_rate} {int(s['computes']):>8} {seconds(s['mean_compute'])} "
+            f"{int(s['lock_waits']):>10} {seconds(s['mean_lock_wait'])} {int(s['lock_failures']):>10} "
+            f"{int(s['compute_errors']):>6} {size}"
+        )
+    return "\n".join(rows)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """
+    Serves /metrics for Prometheus on a background thread. Every worker reads the same
+    Redis series, so scraping any one of them covers the whole fleet.
+    """
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"[Metrics] Serving /metrics on port {port}")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the worker's per-stage timing metrics.")
+    parser.add_argument("--prometheus", action="store_true", help="Print the Prometheus text format instead of a summary")
+    parser.add_argument("--compression", action="store_true", help="Sample stored values and print their compression ratio")
+    parser.add_argument("--cache", action="store_true", help="Print the cache decorators' counters per function")
+    args = parser.parse_args()
+    if args.cache:
+        print(render_cache_summary())
+    elif args.compression:
+        for pattern in ("transcript:*", "get_*"):
+            stats = measure_compression(pattern)
+            ratio = f"{stats['ratio']:.2f}x" if stats["ratio"] else "-"
+            print(
+                f"{pattern:<14} {stats['keys']:>5} keys, {stats['compressed_keys']:>5} compressed, "
+                f"{stats['raw_bytes'] / 1e6:.2f} MB raw, {stats['stored_bytes'] / 1e6:.2f} MB stored, ratio {ratio}"
+            )
+    else:
+        print(render_prometheus() if args.prometheus else render_summary())
@@ -0,0 +1,73 @@
+# pipeline_stages.py
+#
+# A small staged pipeline: each stage has its own thread pool and an input queue, and a
+# stage handler decides which stage an item goes to next. The worker uses it to overlap
+# different jobs' caption fetches, downloads, transcriptions and stores.
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# A stage handler processes an item and returns the name of the next stage, or None if
+# the item is done.
+StageHandler = Callable[[Any], Optional[str]]
+
+class StagedPipeline:
+    """
+    Runs items through named stages. Every stage has a bounded queue of queue_size
+    items and its own pool of threads. Handlers should catch their own errors; if one
+    raises anyway, on_error is called with (stage_name, item, exception) and returns the
+    next stage for the item (or None to drop it).
+
+    Items may be routed back to an earlier stage (e.g. a fallback method), so a stage
+    thread can block while putting into a full queue. To avoid a cycle of full queues,
+    callers should keep the number of items in the pipeline at or below queue_size.
+    """
+    def __init__(
+        self,
+        stages: Dict[str, Tuple[StageHandler, int]],
+        queue_size: int,
+        on_error: Callable[[str, Any, Exception], Optional[str]]
+    ):
+        self.stages = stages
+        self.on_error = on_error
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in stages}
+        self.threads = []
+
+    def start(self):
+        for name, (_, workers) in self.stages.items():
+            for i in range(workers):
+                thread = threading.Thread(target=self._run_stage, args=(name,), name=f"{name}-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        logging.info(f"[Pipeline] Started stages: { {name: workers for name, (_, workers) in self.stages.items()} }")
+
+    def submit(self, stage_name: str, item: Any):
+        """
+        Puts an item on a stage's queue, blocking while that queue is full.
+        """
+        self.queues[stage_name].put(item)
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {name: q.qsize() for name, q in self.queues.items()}
+
+    def _run_stage(self, name: str):
+        handler, _ = self.stages[name]
+        stage_queue = self.queues[name]
+        while True:
+            item = stage_queue.get()
+            try:
+                next_stage = handler(item)
+            except Exception as e:
+                logging.exception(f"[Pipeline] Stage '{name}' failed on {item}: {e}")
+                try:
+                    next_stage = self.on_error(name, item, e)
+                except Exception as handler_error:
+                    logging.exception(f"[Pipeline] Error handler failed for {item}, dropping it: {handler_error}")
+                    next_stage = None
+            finally:
+                stage_queue.task_done()
+
+            if next_stage:
+                self.submit(next_stage, item)
@@ -9,6 +9,10 @@ from langchain_anthropic import ChatAnthropic
 from redis_wrapper import cache_azure_redis, stream_cache_azure_redis
 
 OPENAI_CHAT_ENGINE = "gpt-4o"
+CLAUDE_CHAT_ENGINE = "claude-4-sonnet-20250514"
+# Bump when prompt handling changes in a way the prompt text itself doesn't capture, to
+# invalidate cached responses. The model is part of the cache version too.
+PROMPT_VERSION = "1"
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 
@@ -19,16 +23,16 @@ web_search_tool = {
 }
 
 claude_model = ChatAnthropic(
-    model="claude-4-sonnet-20250514",
+    model=CLAUDE_CHAT_ENGINE,
     max_tokens=8000
 )
 smart_model = claude_model.bind_tools([web_search_tool])
-fast_model = ChatOpenAI(model="gpt-4o")
+fast_model = ChatOpenAI(model=OPENAI_CHAT_ENGINE)
 parser = StrOutputParser()
 fast_chain = fast_model | parser
 smart_chain = smart_model | parser
 
-@cache_azure_redis
+@cache_azure_redis(version=f"{PROMPT_VERSION}:{OPENAI_CHAT_ENGINE}")
 def get_gpt_input(question: str, transcript: str, json=True) -> str:
     messages = [
         SystemMessage(content=question),
@@ -36,7 +40,7 @@ def get_gpt_input(question: str, transcript: str, json=True) -> str:
     ]
     return fast_chain.invoke(messages)
 
-@stream_cache_azure_redis
+@stream_cache_azure_redis(version=f"{PROMPT_VERSION}:{OPENAI_CHAT_ENGINE}")
 def get_streaming_gpt_input(question: str, transcript: str):
     messages = [
         SystemMessage(content=question),
@@ -47,7 +51,7 @@ def get_streaming_gpt_input(question: str, transcript: str):
         total += result
         yield total
 
-@stream_cache_azure_redis
+@stream_cache_azure_redis(version=f"{PROMPT_VERSION}:{CLAUDE_CHAT_ENGINE}")
 def get_streaming_claude_input(question: str, transcript: str):
     messages = [
         SystemMessage(content=question),
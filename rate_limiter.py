@@ -0,0 +1,151 @@
+# rate_limiter.py
+#
+# A token bucket in Redis shared by every worker, so concurrent jobs and workers stay
+# under a provider's rate limit together. Callers wait briefly for a token instead of
+# failing, and a rate-limited (429) response pauses the bucket for everyone and is
+# retried with backoff.
+
+import logging
+import time
+from functools import wraps
+from typing import Callable, Optional
+
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from redis_wrapper import value_cache
+
+TOKEN_WAIT_TIMEOUT = 120   # seconds a call may queue for a token before giving up
+RATE_LIMIT_RETRIES = 5     # attempts at a call that keeps being rate limited
+MAX_BACKOFF = 60           # cap on the randomized exponential backoff, in seconds
+
+# Takes a token if one is available. Tokens refill continuously at ARGV[1] per second up
+# to ARGV[2]; the bucket can also be paused until a time (a provider's Retry-After).
+# Uses the Redis server clock so workers' clocks don't need to agree (replicating the
+# script's effects rather than the script, which Redis versions before 5 need for that).
+#
+# KEYS[1]: bucket hash
+# ARGV: rate per second, capacity, key TTL in seconds
+# Returns: milliseconds to wait before trying again, 0 if a token was taken
+ACQUIRE_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local rate = tonumber(ARGV[1]) / 1000
+local capacity = tonumber(ARGV[2])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'paused_until')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+local paused_until = tonumber(bucket[3]) or 0
+if paused_until > now then
+    return paused_until - now
+end
+
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return wait
+"""
+
+# Pauses the bucket for ARGV[1] milliseconds and empties it, unless it's already paused
+# for longer.
+PAUSE_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local until_ms = now + tonumber(ARGV[1])
+local paused_until = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if until_ms > paused_until then
+    redis.call('HSET', KEYS[1], 'paused_until', until_ms, 'tokens', '0', 'updated', until_ms)
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return until_ms
+"""
+
+acquire_script = value_cache.register_script(ACQUIRE_SCRIPT)
+pause_script = value_cache.register_script(PAUSE_SCRIPT)
+
+class RateLimitTimeout(RuntimeError):
+    """
+    Raised when no token became available within the wait timeout.
+    """
+
+class RateLimiter:
+    """
+    A distributed token bucket: rate_per_minute calls on average across all workers,
+    with bursts of up to burst calls.
+    """
+    def __init__(self, name: str, rate_per_minute: float, burst: int = 1):
+        self.key = f"rate_limit:{name}"
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        # Long enough for an idle bucket to refill completely before it is dropped
+        self.ttl = int(self.burst / self.rate) + 60
+
+    def acquire(self, timeout: float = TOKEN_WAIT_TIMEOUT):
+        """
+        Blocks until a token is taken.
+
+        :raises RateLimitTimeout: If no token is available within timeout seconds.
+        """
+        deadline = time.time() + timeout
+        while True:
+            wait_ms = int(acquire_script(keys=[self.key], args=[self.rate, self.burst, self.ttl]))
+            if wait_ms <= 0:
+                return
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RateLimitTimeout(f"No '{self.name}' rate limit token within {timeout}s")
+            time.sleep(min(wait_ms / 1000.0, remaining))
+
+    def pause(self, seconds: float):
+        """
+        Stops every worker from taking tokens for the given time, e.g. after a 429.
+        """
+        pause_script(keys=[self.key], args=[int(seconds * 1000), self.ttl + int(seconds)])
+        logging.warning(f"[RateLimit] Pausing '{self.name}' for {seconds:.1f}s")
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    The Retry-After header of an HTTP error response, if it has one.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def rate_limited(limiter: RateLimiter, is_rate_limit_error: Callable[[Exception], bool]):
+    """
+    Decorator that takes a token from limiter before every call. If the call is rate
+    limited anyway, the bucket is paused for every worker (for the provider's
+    Retry-After when given) and the call is retried with randomized exponential backoff.
+    """
+    def decorator(func):
+        def before_retry(retry_state):
+            error = retry_state.outcome.exception()
+            limiter.pause(retry_after_seconds(error) or 2 ** retry_state.attempt_number)
+            logging.warning(f"[RateLimit] {func.__name__} was rate limited (attempt {retry_state.attempt_number}), retrying: {error}")
+
+        @retry(
+            retry=retry_if_exception(is_rate_limit_error),
+            wait=wait_random_exponential(multiplier=1, max=MAX_BACKOFF),
+            stop=stop_after_attempt(RATE_LIMIT_RETRIES),
+            before_sleep=before_retry,
+            reraise=True
+        )
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            limiter.acquire()
+            return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
@@ -1,123 +1,712 @@
+import asyncio
+import atexit
+import base64
 import datetime
+import hashlib
+import inspect
+import json
 import logging
 import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
 from functools import wraps
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import redis
+import redis.asyncio
+import redis.asyncio.retry
+import redis.retry
+from redis.backoff import ExponentialBackoff
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 AZURE_REDIS_HOST = os.environ.get("AZURE_REDIS_HOST")
 AZURE_REDIS_KEY = os.environ.get("AZURE_REDIS_KEY")
+REDIS_PORT = 6380
+
+# Connection pool settings, shared by every client from make_redis_client. The socket
+# timeout bounds how long any command can hang on a stalled connection, so every
+# blocking read (XREAD/XREADGROUP BLOCK, pub/sub waits) must stay below it: use
+# blocking_ms to clamp them.
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "32"))  # per client
+# Pub/sub subscribers hold a connection for as long as they listen (one per Streamlit
+# session waiting on a transcript), so they get their own pool, sized for the expected
+# number of concurrent waiters. When it runs out, new waiters fall back to polling and
+# every other command keeps its own pool.
+REDIS_PUBSUB_MAX_CONNECTIONS = int(os.environ.get("REDIS_PUBSUB_MAX_CONNECTIONS", "256"))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", "20"))  # seconds to wait for a free connection
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "10"))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "45"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", "30"))  # ping connections idle this long before use
+REDIS_KEEPALIVE = os.environ.get("REDIS_KEEPALIVE", "1") == "1"
+REDIS_RETRIES = int(os.environ.get("REDIS_RETRIES", "3"))  # retries of a command after a timeout or dropped connection
+BLOCKING_READ_MARGIN = 5  # seconds a blocking read leaves between its block time and the socket timeout
+
 DEFAULT_EXPIRATION = datetime.timedelta(days=30)
 DEFAULT_LOCK_TIMEOUT = 120
-QUEUE_NAME = "transcript_queue"
-WORKER_HEARTBEAT = "worker:heartbeat"
-
-value_cache = redis.StrictRedis(
-    host=AZURE_REDIS_HOST, 
-    port=6380,
-    password=AZURE_REDIS_KEY, 
-    ssl=True, 
-    decode_responses=True, 
-    db=0
-)
-
-lock_cache = redis.StrictRedis(
-    host=AZURE_REDIS_HOST, 
-    port=6380,
-    password=AZURE_REDIS_KEY, 
-    ssl=True, 
-    decode_responses=True, 
-    db=1
-)
-
-def cache_azure_redis(func):
+# Part of every cache key. Bump it to invalidate every cached result at once; bump a
+# decorator's own version (e.g. when its prompt or model changes) to invalidate one function.
+CACHE_KEY_VERSION = "1"
+# While a streamed result is being computed, its chunks are also appended to a Redis
+# stream so concurrent callers can follow along instead of waiting on the lock
+LIVE_STREAM_EXPIRATION = 5 * 60   # seconds a live stream is kept, refreshed on every chunk
+LIVE_STREAM_BLOCK_MS = 5 * 1000   # longest single blocking read while following a stream
+LIVE_STREAM_IDLE_TIMEOUT = 60     # seconds without a chunk before a follower gives up
+QUEUE_NAME = "transcript_queue"  # legacy list queue, migrated into the job streams by the worker
+LEGACY_QUEUES = [QUEUE_NAME, f"{QUEUE_NAME}:fast", f"{QUEUE_NAME}:slow"]
+FAST_LANE = "transcript_jobs:fast"  # stream of caption fetches, ~1 second each
+SLOW_LANE = "transcript_jobs:slow"  # stream of Whisper jobs, minutes each
+BACKGROUND_LANE = "transcript_jobs:background"  # cache-warming jobs, only run when the other lanes are empty
+JOB_GROUP = "transcript_workers"  # consumer group shared by all workers on both lanes
+QUEUE_LANES = {
+    "youtube": FAST_LANE,
+    "audio": SLOW_LANE,
+}
+WORKER_REGISTRY = "workers"  # hash of worker ID to its advertised capacity and last heartbeat
+WORKER_TTL = 120  # seconds without a heartbeat before a worker is considered gone
+TRANSCRIPT_EVENTS = "transcript_events"  # pub/sub channel prefix, one channel per video
+
+# Values are compressed transparently: a header, a codec letter and the compressed
+# bytes as base85 text, so they still round-trip through the decode_responses clients.
+# Values without the header are legacy plain text and are returned as they are.
+CODEC_HEADER = "\x1bC"
+COMPRESSION_CODEC = os.environ.get("REDIS_COMPRESSION", "zstd" if zstandard else "zlib")  # or "none"
+COMPRESSION_MIN_CHARS = 512  # shorter values are stored as plain text
+COMPRESSION_LEVEL = 6
+
+# In-process cache in front of Redis for the cache decorators. Values cached in Redis
+# never change, so the TTL only bounds how long an explicit invalidation can go unseen
+# when pub/sub invalidation is off.
+LOCAL_CACHE_BYTES = int(os.environ.get("LOCAL_CACHE_MB", "64")) * 1024 * 1024
+LOCAL_CACHE_TTL = int(os.environ.get("LOCAL_CACHE_TTL", "300"))
+LOCAL_CACHE_INVALIDATION = os.environ.get("LOCAL_CACHE_INVALIDATION", "0") == "1"
+CACHE_INVALIDATION_CHANNEL = "cache_invalidation"
+
+# Per-function counters and timings of the cache decorators. Each process adds up its
+# own and flushes them into one Redis hash per function every CACHE_STATS_FLUSH_INTERVAL,
+# so cache hits served from local_cache don't cost a round trip.
+CACHE_STATS_PREFIX = "cache_stats"
+CACHE_STATS_FUNCTIONS = "cache_stats:functions"  # set of every function with stats
+CACHE_STATS_FLUSH_INTERVAL = 10  # seconds
+CACHE_STAT_FIELDS = [
+    "local_hits",         # served from this process's local_cache
+    "hits",               # served from Redis
+    "misses",             # not cached when first checked
+    "hits_after_lock",    # cached by another caller while this one waited for the lock
+    "live_follows",       # followed another caller's live stream instead of waiting
+    "lock_waits",
+    "lock_wait_seconds",
+    "lock_failures",      # gave up waiting for the lock
+    "computes",
+    "compute_seconds",
+    "compute_errors",
+    "stored_values",
+    "stored_bytes",       # as stored in Redis, after compression
+]
+
+compression_stats = {"raw_bytes": 0, "stored_bytes": 0, "compressed": 0, "plain": 0}
+compression_stats_lock = threading.Lock()
+
+def make_redis_client(db: int = 0, asynchronous: bool = False, max_connections: int = REDIS_MAX_CONNECTIONS, **overrides):
+    """
+    A client for the Azure Redis instance with its own connection pool. Callers wait
+    up to REDIS_POOL_TIMEOUT for a free connection instead of failing when the pool is
+    exhausted, idle connections are health-checked before use, and commands are retried
+    with backoff after a timeout or a dropped connection.
+
+    :param db: Database number, 0 for values and 1 for locks.
+    :param asynchronous: Return a redis.asyncio client instead, for use from one event loop.
+    :param max_connections: Size of the client's pool.
+    :param overrides: Connection settings to use instead of the defaults, e.g. socket_timeout.
+    """
+    module = redis.asyncio if asynchronous else redis
+    settings = dict(
+        host=AZURE_REDIS_HOST,
+        port=REDIS_PORT,
+        password=AZURE_REDIS_KEY,
+        db=db,
+        decode_responses=True,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_keepalive=REDIS_KEEPALIVE,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True,
+        retry=module.retry.Retry(ExponentialBackoff(cap=2, base=0.1), REDIS_RETRIES),
+    )
+    settings.update(overrides)
+    pool = module.BlockingConnectionPool(
+        connection_class=module.SSLConnection,
+        max_connections=max_connections,
+        timeout=REDIS_POOL_TIMEOUT,
+        **settings
+    )
+    return module.StrictRedis(connection_pool=pool)
+
+def blocking_ms(requested_ms: int) -> int:
+    """
+    Clamps the block time of a blocking read so the server answers before the client's
+    socket timeout fires, which would otherwise turn an empty read into an error.
+    """
+    limit_ms = int((REDIS_SOCKET_TIMEOUT - BLOCKING_READ_MARGIN) * 1000)
+    return max(1, min(requested_ms, limit_ms))
+
+value_cache = make_redis_client(db=0)
+lock_cache = make_redis_client(db=1)
+# For pub/sub subscriptions only, so long waits can't exhaust value_cache's pool
+pubsub_cache = make_redis_client(db=0, max_connections=REDIS_PUBSUB_MAX_CONNECTIONS)
+
+# asyncio clients for async code paths. Connections are made lazily, and like any
+# redis.asyncio client these must only be used from one event loop.
+async_value_cache = make_redis_client(db=0, asynchronous=True)
+async_lock_cache = make_redis_client(db=1, asynchronous=True)
+
+class LocalCache:
+    """
+    A thread-safe LRU cache with a TTL and a size limit in bytes (counting keys and
+    values as UTF-8), with hit, miss and eviction counts.
+    """
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, expires_at, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any):
+        size = len(key.encode("utf-8")) + (len(value.encode("utf-8")) if isinstance(value, str) else len(str(value)))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, time.time() + self.ttl, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+local_cache = LocalCache(LOCAL_CACHE_BYTES, LOCAL_CACHE_TTL)
+invalidation_thread = None
+invalidation_lock = threading.Lock()
+pending_cache_stats = defaultdict(lambda: defaultdict(float))  # function name -> field -> increment
+cache_stats_lock = threading.Lock()
+cache_stats_flushed_at = time.time()
+
+def cache_stats_key(name: str) -> str:
+    return f"{CACHE_STATS_PREFIX}:{name}"
+
+def _add_cache_stats(name: str, increments: Dict[str, float]) -> bool:
+    """
+    Adds to a function's pending cache counters.
+
+    :return: Whether CACHE_STATS_FLUSH_INTERVAL has passed and the caller should flush.
+    """
+    global cache_stats_flushed_at
+    with cache_stats_lock:
+        stats = pending_cache_stats[name]
+        for field, amount in increments.items():
+            stats[field] += amount
+        due = time.time() - cache_stats_flushed_at >= CACHE_STATS_FLUSH_INTERVAL
+        if due:
+            cache_stats_flushed_at = time.time()
+    return due
+
+def record_cache_stats(name: str, **increments: float):
+    """
+    Adds to a function's cache counters, e.g. record_cache_stats("get_sift_report", hits=1).
+    Flushes every function's counters to Redis once CACHE_STATS_FLUSH_INTERVAL has passed.
+    """
+    if _add_cache_stats(name, increments):
+        flush_cache_stats()
+
+async def async_record_cache_stats(name: str, **increments: float):
+    """
+    record_cache_stats for the async decorators. The flush uses the synchronous client,
+    so it runs in a thread rather than blocking the event loop.
+    """
+    if _add_cache_stats(name, increments):
+        await asyncio.to_thread(flush_cache_stats)
+
+def flush_cache_stats():
+    """
+    Writes this process's pending cache counters to Redis, in one round trip.
+    """
+    with cache_stats_lock:
+        pending = {name: dict(stats) for name, stats in pending_cache_stats.items() if stats}
+        pending_cache_stats.clear()
+    if not pending:
+        return
+    pipe = value_cache.pipeline(transaction=False)
+    for name, stats in pending.items():
+        pipe.sadd(CACHE_STATS_FUNCTIONS, name)
+        for field, amount in stats.items():
+            if isinstance(amount, float) and not amount.is_integer():
+                pipe.hincrbyfloat(cache_stats_key(name), field, amount)
+            else:
+                pipe.hincrby(cache_stats_key(name), field, int(amount))
+    try:
+        pipe.execute()
+    except Exception as e:
+        # Stats are best effort and must never fail a cached call
+        logging.warning(f"[cache_stats] Could not flush cache stats: {e}")
+
+atexit.register(flush_cache_stats)
+
+def get_cache_stats() -> Dict[str, dict]:
+    """
+    Cache counters of every decorated function, across all processes, including this
+    process's unflushed ones.
+
+    :return: Dict of function name to every CACHE_STAT_FIELDS counter, plus "hit_rate"
+             (share of calls answered from a cache without computing), "mean_lock_wait",
+             "mean_compute" (seconds) and "mean_stored_bytes", each None without data.
+    """
+    flush_cache_stats()
+    names = sorted(value_cache.smembers(CACHE_STATS_FUNCTIONS))
+    pipe = value_cache.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(cache_stats_key(name))
+
+    result = {}
+    for name, fields in zip(names, pipe.execute()):
+        stats = {field: float(fields.get(field, 0)) for field in CACHE_STAT_FIELDS}
+        cached = stats["local_hits"] + stats["hits"] + stats["hits_after_lock"] + stats["live_follows"]
+        calls = stats["local_hits"] + stats["hits"] + stats["misses"]
+        stats["hit_rate"] = cached / calls if calls else None
+        stats["mean_lock_wait"] = stats["lock_wait_seconds"] / stats["lock_waits"] if stats["lock_waits"] else None
+        stats["mean_compute"] = stats["compute_seconds"] / stats["computes"] if stats["computes"] else None
+        stats["mean_stored_bytes"] = stats["stored_bytes"] / stats["stored_values"] if stats["stored_values"] else None
+        result[name] = stats
+    return result
+
+def reset_cache_stats(name: Optional[str] = None):
+    """
+    Clears the cache counters of one function, or of every function.
+    """
+    names = [name] if name else list(value_cache.smembers(CACHE_STATS_FUNCTIONS))
+    if names:
+        value_cache.delete(*[cache_stats_key(n) for n in names])
+        value_cache.srem(CACHE_STATS_FUNCTIONS, *names)
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "s":
+        return zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(data)
+    return zlib.compress(data, COMPRESSION_LEVEL)
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "s":
+        if zstandard is None:
+            raise RuntimeError("Value is zstd compressed but the zstandard package isn't installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+def encode_value(text: str) -> str:
+    """
+    Compresses a string for storage in Redis, unless it is short, compression is
+    disabled or it doesn't get smaller.
+    """
+    raw_bytes = len(text.encode("utf-8"))
+    encoded = text
+    if COMPRESSION_CODEC != "none" and len(text) >= COMPRESSION_MIN_CHARS:
+        codec = "s" if COMPRESSION_CODEC == "zstd" and zstandard else "z"
+        candidate = CODEC_HEADER + codec + base64.b85encode(_compress(text.encode("utf-8"), codec)).decode("ascii")
+        if len(candidate) < raw_bytes:
+            encoded = candidate
+
+    with compression_stats_lock:
+        compression_stats["raw_bytes"] += raw_bytes
+        compression_stats["stored_bytes"] += len(encoded.encode("utf-8"))
+        compression_stats["compressed" if encoded is not text else "plain"] += 1
+    return encoded
+
+def decode_value(value: Optional[str]) -> Optional[str]:
+    """
+    Reverses encode_value. Legacy uncompressed values and None pass through unchanged.
+    """
+    if not value or not value.startswith(CODEC_HEADER):
+        return value
+    codec = value[len(CODEC_HEADER)]
+    return _decompress(base64.b85decode(value[len(CODEC_HEADER) + 1:]), codec).decode("utf-8")
+
+def compression_ratio() -> Optional[float]:
+    """
+    Raw bytes over stored bytes for every value encoded by this process, or None if
+    nothing has been encoded yet.
+    """
+    with compression_stats_lock:
+        stored = compression_stats["stored_bytes"]
+        return compression_stats["raw_bytes"] / stored if stored else None
+
+def measure_compression(pattern: str = "transcript:*", sample_size: int = 200) -> dict:
+    """
+    Samples stored values matching a key pattern and compares their size in Redis with
+    their decoded size, to see how much memory the codec saves in practice.
+
+    :return: {"keys", "compressed_keys", "stored_bytes", "raw_bytes", "ratio"}
+    """
+    keys = []
+    for key in value_cache.scan_iter(match=pattern, count=500):
+        keys.append(key)
+        if len(keys) >= sample_size:
+            break
+    values = value_cache.mget(keys) if keys else []
+
+    stored_bytes = raw_bytes = compressed = 0
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        stored_bytes += len(value.encode("utf-8"))
+        raw_bytes += len(decode_value(value).encode("utf-8"))
+        compressed += value.startswith(CODEC_HEADER)
+    return {
+        "keys": len(keys),
+        "compressed_keys": compressed,
+        "stored_bytes": stored_bytes,
+        "raw_bytes": raw_bytes,
+        "ratio": raw_bytes / stored_bytes if stored_bytes else None,
+    }
+
+def make_cache_key(func, version: str, args: tuple, kwargs: dict) -> str:
+    """
+    A short, content-addressed cache key: the function name and version tag followed by
+    a SHA-256 of the version tags and the arguments. Arguments are bound to the
+    function's parameters (defaults included) and serialized canonically, so calling
+    with positional or keyword arguments gives the same key.
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = bound.arguments
+    except TypeError:
+        params = {"args": args, "kwargs": kwargs}
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=repr)
+    digest = hashlib.sha256(f"{CACHE_KEY_VERSION}:{version}:{canonical}".encode("utf-8")).hexdigest()
+    return f"{func.__name__}:v{version}:{digest}"
+
+def invalidate_cached(key: str):
+    """
+    Drops a cached result from Redis and from this process's local cache. With
+    LOCAL_CACHE_INVALIDATION on, other processes are told to drop it as well;
+    otherwise they keep serving it until their local copy expires.
+    Decorated functions expose this as func.invalidate(*args, **kwargs).
+    """
+    # A finished live stream would otherwise be replayed as the result
+    value_cache.delete(key, live_stream_key(key))
+    local_cache.delete(key)
+    if LOCAL_CACHE_INVALIDATION:
+        value_cache.publish(CACHE_INVALIDATION_CHANNEL, key)
+
+async def async_invalidate_cached(key: str):
+    """
+    invalidate_cached for async code paths.
+    """
+    await async_value_cache.delete(key, live_stream_key(key))
+    local_cache.delete(key)
+    if LOCAL_CACHE_INVALIDATION:
+        await async_value_cache.publish(CACHE_INVALIDATION_CHANNEL, key)
+
+def _listen_for_invalidations():
+    while True:
+        try:
+            pubsub = pubsub_cache.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            # Anything invalidated while disconnected was missed, so start over
+            local_cache.clear()
+            while True:
+                # Wait in short reads so an idle channel never reaches the socket timeout
+                message = pubsub.get_message(timeout=blocking_ms(LIVE_STREAM_BLOCK_MS) / 1000)
+                if message and message["type"] == "message":
+                    local_cache.delete(message["data"])
+        except Exception as e:
+            logging.warning(f"[local_cache] Invalidation listener failed, reconnecting: {e}")
+            time.sleep(5)
+
+def start_invalidation_listener():
+    """
+    Subscribes this process to cache invalidations, once. Called by the cache
+    decorators when LOCAL_CACHE_INVALIDATION is on.
+    """
+    global invalidation_thread
+    with invalidation_lock:
+        if invalidation_thread is None or not invalidation_thread.is_alive():
+            invalidation_thread = threading.Thread(target=_listen_for_invalidations, name="cache-invalidation", daemon=True)
+            invalidation_thread.start()
+
+def cache_azure_redis(func=None, *, version: str = "1"):
     """
     A decorator that caches the return value of a function in Azure Redis.
     Utilizes a lock in db=1 to avoid race conditions when multiple processes
-    call the same function concurrently.
+    call the same function concurrently. Results are also kept in the in-process
+    local_cache, which is checked before Redis.
+
+    Use as @cache_azure_redis, or @cache_azure_redis(version="2") to tag the keys
+    with a version; changing it invalidates the function's cached results.
     """
+    if func is None:
+        return lambda f: cache_azure_redis(f, version=version)
+    if LOCAL_CACHE_INVALIDATION:
+        start_invalidation_listener()
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        key = f"{func.__name__}:{args}:{kwargs}"
-        result = value_cache.get(key)
+        key = make_cache_key(func, version, args, kwargs)
+        name = func.__name__
+        result = local_cache.get(key)
+        if result is not None:
+            record_cache_stats(name, local_hits=1)
+            return result
+
+        result = decode_value(value_cache.get(key))
 
         if result is not None:
             logging.info(f"[cache_azure_redis] Cache hit for key: {key}")
+            record_cache_stats(name, hits=1)
+            local_cache.set(key, result)
             return result
 
         logging.info(f"[cache_azure_redis] Cache miss for key: {key}")
         lock = lock_cache.lock(key, timeout=DEFAULT_LOCK_TIMEOUT, blocking_timeout=DEFAULT_LOCK_TIMEOUT)
         
+        wait_start = time.perf_counter()
         acquired = lock.acquire(blocking=True)
+        record_cache_stats(name, misses=1, lock_waits=1, lock_wait_seconds=time.perf_counter() - wait_start)
         if not acquired:
             # If we fail to acquire the lock, either raise or return None
             logging.error(f"Could not acquire lock for key: {key}")
+            record_cache_stats(name, lock_failures=1)
             return None
         
         try:
             # Check cache again inside the lock to avoid race conditions
-            result = value_cache.get(key)
+            result = decode_value(value_cache.get(key))
             if result is not None:
                 logging.info(f"[cache_azure_redis] Cache hit after waiting for lock: {key}")
+                record_cache_stats(name, hits_after_lock=1)
+                local_cache.set(key, result)
                 return result
 
             # Compute the result
             logging.info(f"[cache_azure_redis] Computing result for key: {key}")
-            result = func(*args, **kwargs)
+            compute_start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                record_cache_stats(name, compute_errors=1)
+                raise
+            record_cache_stats(name, computes=1, compute_seconds=time.perf_counter() - compute_start)
 
             # Cache the result if it's non-empty
             if result:
-                value_cache.setex(key, DEFAULT_EXPIRATION, result)
+                stored = encode_value(result) if isinstance(result, str) else result
+                value_cache.setex(key, DEFAULT_EXPIRATION, stored)
+                record_cache_stats(name, stored_values=1, stored_bytes=len(str(stored).encode("utf-8")))
+                local_cache.set(key, result)
             
             return result
         finally:
             if lock.locked():
                 lock.release()
 
+    wrapper.invalidate = lambda *args, **kwargs: invalidate_cached(make_cache_key(func, version, args, kwargs))
     return wrapper
 
-def stream_cache_azure_redis(func):
+def live_stream_key(key: str) -> str:
+    return f"live:{key}"
+
+def _publish_live_chunk(live_key: str, fields: dict):
+    pipe = value_cache.pipeline(transaction=False)
+    pipe.xadd(live_key, fields)
+    pipe.expire(live_key, LIVE_STREAM_EXPIRATION)
+    pipe.execute()
+
+def _live_chunk(text: str, published: str) -> dict:
+    """
+    The stream entry for a new partial result: only what was added, or the whole text
+    if it didn't just grow.
+    """
+    if text.startswith(published):
+        return {"text": text[len(published):]}
+    return {"full": text}
+
+def _read_live_entries(entries, text: str):
+    """
+    Applies live stream entries to the text built so far.
+
+    :return: (text, last entry ID, True/False once the producer finished/failed or None)
+    """
+    last_id = None
+    for entry_id, fields in entries:
+        last_id = entry_id
+        if "done" in fields:
+            return text, last_id, True
+        if "error" in fields:
+            return text, last_id, False
+        if "full" in fields:
+            text = fields["full"]
+        else:
+            text += fields.get("text", "")
+    return text, last_id, None
+
+def _follow_live_stream(live_key: str):
+    """
+    Yields the cumulative text of a result another caller is streaming, replaying what
+    was produced before joining. Returns True once the producer finished, False if it
+    failed or went quiet for LIVE_STREAM_IDLE_TIMEOUT.
+    """
+    text = ""
+    last_id = "0-0"
+    idle_since = time.time()
+    while time.time() - idle_since < LIVE_STREAM_IDLE_TIMEOUT:
+        response = value_cache.xread({live_key: last_id}, block=blocking_ms(LIVE_STREAM_BLOCK_MS))
+        if not response:
+            continue
+        idle_since = time.time()
+        previous = text
+        text, last_id, finished = _read_live_entries(response[0][1], text)
+        # The batch can end with the done entry, so yield its chunks before returning
+        if text != previous:
+            yield text
+        if finished is not None:
+            return finished
+    return False
+
+def stream_cache_azure_redis(func=None, *, version: str = "1"):
     """
     A decorator for caching streaming outputs in Azure Redis. 
     This is typically useful if the function yields partial results
-    but we also want to store the final result in cache.
+    but we also want to store the final result in cache. Like cache_azure_redis, the
+    final result is also kept in the in-process local_cache. Takes an optional version
+    like cache_azure_redis.
+
+    While a result is being computed, callers asking for the same result don't wait
+    for the lock: they follow the producer's live stream and get the same partial
+    results as it goes, so one upstream call serves every viewer. Partial results are
+    expected to be cumulative (each one extends the last), as the prompts' are.
     """
+    if func is None:
+        return lambda f: stream_cache_azure_redis(f, version=version)
+    if LOCAL_CACHE_INVALIDATION:
+        start_invalidation_listener()
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        key = f"{func.__name__}:{args}:{kwargs}"
+        key = make_cache_key(func, version, args, kwargs)
+        name = func.__name__
+
+        cached_result = local_cache.get(key)
+        if cached_result is not None:
+            record_cache_stats(name, local_hits=1)
+            yield cached_result
+            return
 
-        cached_result = value_cache.get(key)
+        cached_result = decode_value(value_cache.get(key))
         if cached_result is not None:
             logging.info(f"[stream_cache_azure_redis] Cache hit for key: {key}")
+            record_cache_stats(name, hits=1)
+            local_cache.set(key, cached_result)
             # The entire result is cached; yield it once and return
             yield cached_result
             return
 
         logging.info(f"[stream_cache_azure_redis] Cache miss for key: {key}")
         lock = lock_cache.lock(key, timeout=DEFAULT_LOCK_TIMEOUT, blocking_timeout=DEFAULT_LOCK_TIMEOUT)
-        
-        acquired = lock.acquire(blocking=True)
+        live_key = live_stream_key(key)
+
+        record_cache_stats(name, misses=1)
+        acquired = lock.acquire(blocking=False)
+        if not acquired:
+            # Someone else is computing it: follow along live
+            logging.info(f"[stream_cache_azure_redis] Following live stream for key: {key}")
+            finished = yield from _follow_live_stream(live_key)
+            if finished:
+                record_cache_stats(name, live_follows=1)
+                return
+            # The producer failed or stalled, so take over once its lock is released
+            logging.warning(f"[stream_cache_azure_redis] Live stream ended early, waiting for lock: {key}")
+            wait_start = time.perf_counter()
+            acquired = lock.acquire(blocking=True)
+            record_cache_stats(name, lock_waits=1, lock_wait_seconds=time.perf_counter() - wait_start)
         if not acquired:
             logging.error(f"Could not acquire lock for key: {key}")
+            record_cache_stats(name, lock_failures=1)
             return
 
+        outcome = None  # the live stream's closing entry, once this caller computes
         try:
             # Double-check the cache inside the lock
-            cached_result = value_cache.get(key)
+            cached_result = decode_value(value_cache.get(key))
             if cached_result is not None:
                 logging.info(f"[stream_cache_azure_redis] Cache hit after waiting for lock: {key}")
+                record_cache_stats(name, hits_after_lock=1)
+                local_cache.set(key, cached_result)
                 yield cached_result
                 return
 
             logging.info(f"[stream_cache_azure_redis] Computing streamed result for key: {key}")
             last_result = None
+            # Leftovers of an earlier producer must not be replayed to followers
+            value_cache.delete(live_key)
+            published = ""
+            outcome = {"error": "producer stopped"}
+            compute_start = time.perf_counter()
 
             for partial in func(*args, **kwargs):
                 last_result = partial
+                text = "".join(partial) if isinstance(partial, list) else str(partial)
+                try:
+                    _publish_live_chunk(live_key, _live_chunk(text, published))
+                    published = text
+                except Exception as e:
+                    logging.warning(f"[stream_cache_azure_redis] Could not publish live chunk for key: {key}, {e}")
                 yield partial
 
             # Cache the final result if present
@@ -125,16 +714,305 @@ def stream_cache_azure_redis(func):
                 # Ensure we have a string-like object to store
                 final_str = "".join(last_result) if isinstance(last_result, list) else str(last_result)
                 logging.info(f"[stream_cache_azure_redis] Caching streamed result for key: {key}")
-                value_cache.setex(key, DEFAULT_EXPIRATION, final_str)
+                stored = encode_value(final_str)
+                value_cache.setex(key, DEFAULT_EXPIRATION, stored)
+                record_cache_stats(name, stored_values=1, stored_bytes=len(stored.encode("utf-8")))
+                local_cache.set(key, final_str)
+            outcome = {"done": "1"}
         finally:
+            if outcome is not None:
+                # Includes time the caller spent consuming partial results
+                if outcome.get("done"):
+                    record_cache_stats(name, computes=1, compute_seconds=time.perf_counter() - compute_start)
+                else:
+                    record_cache_stats(name, compute_errors=1)
+                try:
+                    _publish_live_chunk(live_key, outcome)
+                except Exception as e:
+                    logging.warning(f"[stream_cache_azure_redis] Could not close live stream for key: {key}, {e}")
             if lock.locked():
                 lock.release()
 
+    wrapper.invalidate = lambda *args, **kwargs: invalidate_cached(make_cache_key(func, version, args, kwargs))
+    return wrapper
+
+async def _async_publish_live_chunk(live_key: str, fields: dict):
+    pipe = async_value_cache.pipeline(transaction=False)
+    pipe.xadd(live_key, fields)
+    pipe.expire(live_key, LIVE_STREAM_EXPIRATION)
+    await pipe.execute()
+
+async def _async_follow_live_stream(live_key: str, state: dict):
+    """
+    _follow_live_stream for async code paths. Async generators can't return a value,
+    so state["finished"] is set to True once the producer finished.
+    """
+    state["finished"] = False
+    text = ""
+    last_id = "0-0"
+    idle_since = time.time()
+    while time.time() - idle_since < LIVE_STREAM_IDLE_TIMEOUT:
+        response = await async_value_cache.xread({live_key: last_id}, block=blocking_ms(LIVE_STREAM_BLOCK_MS))
+        if not response:
+            continue
+        idle_since = time.time()
+        previous = text
+        text, last_id, finished = _read_live_entries(response[0][1], text)
+        # The batch can end with the done entry, so yield its chunks before returning
+        if text != previous:
+            yield text
+        if finished is not None:
+            state["finished"] = finished
+            return
+
+def async_cache_azure_redis(func=None, *, version: str = "1"):
+    """
+    cache_azure_redis for async functions, using the asyncio clients. Shares keys,
+    locks and the local_cache with the synchronous decorator.
+    """
+    if func is None:
+        return lambda f: async_cache_azure_redis(f, version=version)
+    if LOCAL_CACHE_INVALIDATION:
+        start_invalidation_listener()
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = make_cache_key(func, version, args, kwargs)
+        name = func.__name__
+        result = local_cache.get(key)
+        if result is not None:
+            await async_record_cache_stats(name, local_hits=1)
+            return result
+
+        result = decode_value(await async_value_cache.get(key))
+        if result is not None:
+            logging.info(f"[async_cache_azure_redis] Cache hit for key: {key}")
+            await async_record_cache_stats(name, hits=1)
+            local_cache.set(key, result)
+            return result
+
+        logging.info(f"[async_cache_azure_redis] Cache miss for key: {key}")
+        lock = async_lock_cache.lock(key, timeout=DEFAULT_LOCK_TIMEOUT, blocking_timeout=DEFAULT_LOCK_TIMEOUT)
+        wait_start = time.perf_counter()
+        acquired = await lock.acquire(blocking=True)
+        await async_record_cache_stats(name, misses=1, lock_waits=1, lock_wait_seconds=time.perf_counter() - wait_start)
+        if not acquired:
+            logging.error(f"Could not acquire lock for key: {key}")
+            await async_record_cache_stats(name, lock_failures=1)
+            return None
+
+        try:
+            result = decode_value(await async_value_cache.get(key))
+            if result is not None:
+                logging.info(f"[async_cache_azure_redis] Cache hit after waiting for lock: {key}")
+                await async_record_cache_stats(name, hits_after_lock=1)
+                local_cache.set(key, result)
+                return result
+
+            logging.info(f"[async_cache_azure_redis] Computing result for key: {key}")
+            compute_start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                await async_record_cache_stats(name, compute_errors=1)
+                raise
+            await async_record_cache_stats(name, computes=1, compute_seconds=time.perf_counter() - compute_start)
+            if result:
+                stored = encode_value(result) if isinstance(result, str) else result
+                await async_value_cache.setex(key, DEFAULT_EXPIRATION, stored)
+                await async_record_cache_stats(name, stored_values=1, stored_bytes=len(str(stored).encode("utf-8")))
+                local_cache.set(key, result)
+            return result
+        finally:
+            if await lock.locked():
+                await lock.release()
+
+    wrapper.invalidate = lambda *args, **kwargs: async_invalidate_cached(make_cache_key(func, version, args, kwargs))
+    return wrapper
+
+def async_stream_cache_azure_redis(func=None, *, version: str = "1"):
+    """
+    stream_cache_azure_redis for async generators, using the asyncio clients. Shares
+    keys, locks and live streams with the synchronous decorator, so sync and async
+    callers can follow each other's results.
+    """
+    if func is None:
+        return lambda f: async_stream_cache_azure_redis(f, version=version)
+    if LOCAL_CACHE_INVALIDATION:
+        start_invalidation_listener()
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = make_cache_key(func, version, args, kwargs)
+        name = func.__name__
+
+        cached_result = local_cache.get(key)
+        if cached_result is not None:
+            await async_record_cache_stats(name, local_hits=1)
+        else:
+            cached_result = decode_value(await async_value_cache.get(key))
+            if cached_result is not None:
+                logging.info(f"[async_stream_cache_azure_redis] Cache hit for key: {key}")
+                await async_record_cache_stats(name, hits=1)
+                local_cache.set(key, cached_result)
+        if cached_result is not None:
+            yield cached_result
+            return
+
+        logging.info(f"[async_stream_cache_azure_redis] Cache miss for key: {key}")
+        lock = async_lock_cache.lock(key, timeout=DEFAULT_LOCK_TIMEOUT, blocking_timeout=DEFAULT_LOCK_TIMEOUT)
+        live_key = live_stream_key(key)
+
+        await async_record_cache_stats(name, misses=1)
+        acquired = await lock.acquire(blocking=False)
+        if not acquired:
+            logging.info(f"[async_stream_cache_azure_redis] Following live stream for key: {key}")
+            state = {}
+            async for text in _async_follow_live_stream(live_key, state):
+                yield text
+            if state["finished"]:
+                await async_record_cache_stats(name, live_follows=1)
+                return
+            logging.warning(f"[async_stream_cache_azure_redis] Live stream ended early, waiting for lock: {key}")
+            wait_start = time.perf_counter()
+            acquired = await lock.acquire(blocking=True)
+            await async_record_cache_stats(name, lock_waits=1, lock_wait_seconds=time.perf_counter() - wait_start)
+        if not acquired:
+            logging.error(f"Could not acquire lock for key: {key}")
+            await async_record_cache_stats(name, lock_failures=1)
+            return
+
+        outcome = None  # the live stream's closing entry, once this caller computes
+        try:
+            cached_result = decode_value(await async_value_cache.get(key))
+            if cached_result is not None:
+                logging.info(f"[async_stream_cache_azure_redis] Cache hit after waiting for lock: {key}")
+                await async_record_cache_stats(name, hits_after_lock=1)
+                local_cache.set(key, cached_result)
+                yield cached_result
+                return
+
+            logging.info(f"[async_stream_cache_azure_redis] Computing streamed result for key: {key}")
+            last_result = None
+            await async_value_cache.delete(live_key)
+            published = ""
+            outcome = {"error": "producer stopped"}
+            compute_start = time.perf_counter()
+
+            async for partial in func(*args, **kwargs):
+                last_result = partial
+                text = "".join(partial) if isinstance(partial, list) else str(partial)
+                try:
+                    await _async_publish_live_chunk(live_key, _live_chunk(text, published))
+                    published = text
+                except Exception as e:
+                    logging.warning(f"[async_stream_cache_azure_redis] Could not publish live chunk for key: {key}, {e}")
+                yield partial
+
+            if last_result is not None:
+                final_str = "".join(last_result) if isinstance(last_result, list) else str(last_result)
+                logging.info(f"[async_stream_cache_azure_redis] Caching streamed result for key: {key}")
+                stored = encode_value(final_str)
+                await async_value_cache.setex(key, DEFAULT_EXPIRATION, stored)
+                await async_record_cache_stats(name, stored_values=1, stored_bytes=len(stored.encode("utf-8")))
+                local_cache.set(key, final_str)
+            outcome = {"done": "1"}
+        finally:
+            if outcome is not None:
+                if outcome.get("done"):
+                    await async_record_cache_stats(name, computes=1, compute_seconds=time.perf_counter() - compute_start)
+                else:
+                    await async_record_cache_stats(name, compute_errors=1)
+                try:
+                    await _async_publish_live_chunk(live_key, outcome)
+                except Exception as e:
+                    logging.warning(f"[async_stream_cache_azure_redis] Could not close live stream for key: {key}, {e}")
+            if await lock.locked():
+                await lock.release()
+
+    wrapper.invalidate = lambda *args, **kwargs: async_invalidate_cached(make_cache_key(func, version, args, kwargs))
     return wrapper
 
+def server_time(time_result) -> float:
+    """
+    Seconds since the epoch on the Redis server's clock, from a TIME reply. Heartbeats
+    are stamped and checked against this clock, so workers and readers on different
+    hosts don't need their clocks to agree.
+    """
+    seconds, microseconds = time_result
+    return seconds + microseconds / 1e6
+
+def live_workers(registry: Dict[str, str], now: Optional[float] = None) -> Dict[str, dict]:
+    """
+    Parses the worker registry hash, keeping workers whose heartbeat is recent.
+
+    :param now: The Redis server's time (see server_time), read in the same round trip
+                as the registry. Defaults to reading it now.
+
+    :return: Dict of worker ID to {"slots", "capacity", "busy", "heartbeat"}.
+    """
+    now = server_time(value_cache.time()) if now is None else now
+    workers = {}
+    for worker_id, raw in registry.items():
+        try:
+            info = json.loads(raw)
+        except ValueError:
+            continue
+        if now - info.get("heartbeat", 0) < WORKER_TTL:
+            workers[worker_id] = info
+    return workers
+
+def worker_capacity() -> dict:
+    """
+    Capacity of the worker fleet, read in one round trip.
+
+    :return: {"workers": live worker count, "capacity": jobs the fleet works through in
+             parallel, "free_slots": job slots not currently in use, "queue_depth": dict of
+             lane to waiting jobs, "in_progress": dict of lane to leased jobs}
+    """
+    lanes = [FAST_LANE, SLOW_LANE, BACKGROUND_LANE]
+    pipe = value_cache.pipeline(transaction=False)
+    pipe.time()
+    pipe.hgetall(WORKER_REGISTRY)
+    for lane in lanes:
+        pipe.xlen(lane)
+        pipe.xpending(lane, JOB_GROUP)
+    # A lane without a consumer group yet makes XPENDING fail, which just means no leases
+    now, registry, *lane_results = pipe.execute(raise_on_error=False)
+    workers = live_workers(registry if isinstance(registry, dict) else {}, server_time(now))
+
+    queue_depth, in_progress = {}, {}
+    for i, lane in enumerate(lanes):
+        length, pending = lane_results[2 * i], lane_results[2 * i + 1]
+        length = length if isinstance(length, int) else 0
+        leased = pending.get("pending", 0) if isinstance(pending, dict) else 0
+        # Acknowledged jobs are deleted from the stream, so its length is waiting + leased
+        queue_depth[lane] = max(length - leased, 0)
+        in_progress[lane] = leased
+
+    return {
+        "workers": len(workers),
+        "capacity": sum(info.get("capacity", 0) for info in workers.values()),
+        "free_slots": sum(max(info.get("slots", 0) - info.get("busy", 0), 0) for info in workers.values()),
+        "queue_depth": queue_depth,
+        "in_progress": in_progress,
+    }
+
+def worker_alive() -> bool:
+    """
+    Checks if any worker has sent a heartbeat recently.
+    """
+    return worker_capacity()["workers"] > 0
+
+def transcript_events_channel(video_id: str) -> str:
+    """
+    Pub/sub channel the worker publishes to when a transcript job for the video
+    completes or fails.
+    """
+    return f"{TRANSCRIPT_EVENTS}:{video_id}"
 
-def worker_alive() -> bool: 
+def queue_for_task(task_type: str) -> str:
     """
-    Checks if the worker is alive by setting a key in Redis.
+    Queue lane a job should be pushed to, based on the cost of its first method.
     """
-    return value_cache.get(WORKER_HEARTBEAT) is not None
\ No newline at end of file
+    return QUEUE_LANES.get(task_type, SLOW_LANE)
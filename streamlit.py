@@ -14,6 +14,7 @@ Features include:
 """
 
 import json
+import os
 import time
 import datetime
 import logging
@@ -21,7 +22,7 @@ from typing import Dict, List, Tuple, Optional, Union, Any
 
 import streamlit as st
 
-from redis_wrapper import worker_alive
+from redis_wrapper import compression_ratio, get_cache_stats, local_cache, worker_capacity
 from helpers import escape_all_markdown, escape_unexpected_markdown
 from prompts import (
     get_title_question,
@@ -30,7 +31,7 @@ from prompts import (
     get_context_flow,
     get_sift_report
 )
-from transcripts import get_transcript
+from transcripts import MAX_POLL_TIME, QueueFullError, get_transcript, stream_transcript
 from video_processing import extract_video_id, get_video_title, get_video_duration
 
 # Configure logging
@@ -39,6 +40,9 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Shows cache statistics in the sidebar, for whoever runs the deployment
+SHOW_CACHE_ADMIN = os.environ.get("SHOW_CACHE_ADMIN", "0") == "1"
+
 # Page config and footer styling
 st.set_page_config(page_title="Tube Clues", page_icon="data/magnifying-glass.png")
 
@@ -268,30 +272,58 @@ def context_flow(transcript: str) -> float:
 
     return time.time() - start_time
 
-def transcript_creation_flow(video_id: str) -> str:
+def show_queue_position(video_id: str, position: int, eta: int) -> None:
+    """Let the user know where their transcript job sits in the worker queue."""
+    if position > 1:
+        st.info(f"Transcript request is number {position} in line, estimated ready in {eta} seconds.")
+    elif eta >= 60:
+        # Nothing ahead of it, but a long video still takes a while to transcribe
+        st.info(f"Transcribing the video, estimated ready in about {round(eta / 60)} minute(s).")
+
+def show_queue_full(error: QueueFullError) -> None:
+    """Tell the user the worker is too busy, with an ETA when one is known."""
+    if error.eta:
+        minutes = max(1, round(error.eta / 60))
+        st.warning(f"The transcript worker is busy, estimated wait is about {minutes} minute(s). Please try again later.")
+    else:
+        st.warning("The transcript worker is busy. Please try again later.")
+
+def transcript_creation_flow(video_id: str, video_seconds: Optional[float] = None) -> str:
     """
     Retrieve or create a Whisper transcript for the video.
     
     Args:
         video_id: The YouTube video ID
+        video_seconds: The video duration in seconds, used for queue estimates
         
     Returns:
         str: The video transcript text or empty string if creation failed
     """
     with st.spinner("Creating transcript for video..."):
         try:
-            transcript = get_transcript(video_id, "audio")
+            transcript = None
+            partial_text = st.empty()
+            # Long videos stream finished segments while the rest is still being transcribed
+            for text, is_final in stream_transcript(video_id, "audio", on_queued=show_queue_position, video_seconds=video_seconds):
+                if is_final:
+                    transcript = text
+                else:
+                    partial_text.caption(f"Transcript so far: {escape_all_markdown(text)}")
+            partial_text.empty()
             if not transcript:
                 st.error("Transcript creation failed or worker indicated a problem.")
                 
                 # Provide a retry option
                 if st.button("Try Again", key=f"retry_{video_id}"):
                     st.info("Re-trying transcript creation...")
-                    transcript = get_transcript(video_id, "audio")
+                    transcript = get_transcript(video_id, "audio", video_seconds=video_seconds)
                     if not transcript:
                         st.error("Still failed. Please contact creator or try later.")
                 return ""  # Return empty transcript
                 
+        except QueueFullError as e:
+            show_queue_full(e)
+            return ""
         except Exception as e:
             st.error("Could not create transcript for video (exception).")
             logging.error(f"Transcript creation error: {str(e)}")
@@ -390,12 +422,60 @@ def render_header() -> None:
     )
 
 def check_worker_status() -> None:
-    # Check if worker is available
-    if not worker_alive():
+    # Check if any worker is available
+    capacity = worker_capacity()
+    if not capacity["workers"]:
         st.warning("Worker is out for lunch, only previously cached transcripts will work")
         _, cent_co, _ = st.columns(3)
         with cent_co:
             st.image("data/amigo.png", use_column_width=True)
+        return
+
+    queued = sum(capacity["queue_depth"].values())
+    if queued and not capacity["free_slots"]:
+        st.caption(
+            f"Workers are busy: {queued} video(s) queued across {capacity['workers']} worker(s). "
+            "New transcripts may take a while."
+        )
+
+
+def render_cache_admin() -> None:
+    """Render cache and lock statistics of the cached flows in the sidebar."""
+    with st.sidebar.expander("Cache stats", expanded=False):
+        try:
+            stats = get_cache_stats()
+        except Exception as e:
+            st.caption(f"Cache stats unavailable: {e}")
+            return
+
+        rows = []
+        for name, s in sorted(stats.items(), key=lambda item: -item[1]["compute_seconds"]):
+            rows.append({
+                "function": name,
+                "calls": int(s["local_hits"] + s["hits"] + s["misses"]),
+                "hit rate": f"{s['hit_rate']:.0%}" if s["hit_rate"] is not None else "-",
+                "computes": int(s["computes"]),
+                "mean compute s": round(s["mean_compute"], 2) if s["mean_compute"] is not None else None,
+                "live follows": int(s["live_follows"]),
+                "lock waits": int(s["lock_waits"]),
+                "mean wait s": round(s["mean_lock_wait"], 2) if s["mean_lock_wait"] is not None else None,
+                "lock failures": int(s["lock_failures"]),
+                "errors": int(s["compute_errors"]),
+                "mean KB": round(s["mean_stored_bytes"] / 1024, 1) if s["mean_stored_bytes"] is not None else None,
+            })
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No cached calls recorded yet.")
+
+        local = local_cache.stats()
+        ratio = compression_ratio()
+        summary = f"This process: {local['entries']} local entries ({local['bytes'] / (1024 * 1024):.1f} MB)"
+        if local["hit_rate"] is not None:
+            summary += f", local hit rate {local['hit_rate']:.0%}"
+        st.caption(summary)
+        if ratio:
+            st.caption(f"Compression ratio of values stored by this process: {ratio:.2f}x")
 
 
 def render_input_controls() -> tuple[bool, bool, bool, bool, bool]:
@@ -468,7 +548,7 @@ def render_input_controls() -> tuple[bool, bool, bool, bool, bool]:
     return clickbait_active, bias_active, custom_active, context_active, any_button_clicked
 
 
-def validate_video(video_url: str) -> tuple[bool, str]:
+def validate_video(video_url: str) -> tuple[bool, str, float]:
     """
     Validate the video URL and duration.
     
@@ -476,36 +556,39 @@ def validate_video(video_url: str) -> tuple[bool, str]:
         video_url: The URL to validate
         
     Returns:
-        tuple: (is_valid, video_id)
+        tuple: (is_valid, video_id, duration_seconds)
             - is_valid: True if video is valid, False otherwise
             - video_id: The extracted video ID if valid, empty string otherwise
+            - duration_seconds: The video duration in seconds if valid, 0.0 otherwise
     """
     # Extract and validate video ID
     video_id = extract_video_id(video_url)
     if not video_id:
         st.error("Invalid video URL.")
-        return False, ""
+        return False, "", 0.0
 
     # Validate video length
     duration = get_video_duration(video_id)
-    max_duration = datetime.timedelta(minutes=60)
+    # Long videos are transcribed in parallel chunks by the worker
+    max_duration = datetime.timedelta(minutes=180)
     
     if duration > max_duration:
         st.error(f"Video duration of {duration} is too long. Maximum supported duration is {max_duration}.")
-        return False, ""
+        return False, "", 0.0
         
     if duration > datetime.timedelta(minutes=10):
         st.warning("Video duration is over 10 minutes, processing time may be extended.")
         
-    return True, video_id
+    return True, video_id, duration.total_seconds()
 
 
-def get_video_transcript(video_id: str) -> tuple[str, float, bool]:
+def get_video_transcript(video_id: str, video_seconds: Optional[float] = None) -> tuple[str, float, bool]:
     """
     Retrieve transcript for the video.
     
     Args:
         video_id: The YouTube video ID
+        video_seconds: The video duration in seconds, used for queue estimates
         
     Returns:
         tuple: (transcript, elapsed_time, from_captions)
@@ -517,16 +600,22 @@ def get_video_transcript(video_id: str) -> tuple[str, float, bool]:
     transcript = None
     from_captions = False
 
-    # Try YouTube captions first if enabled
+    # Try YouTube captions first if enabled. Captions don't take longer for long videos,
+    # so this keeps the short wait and leaves long transcriptions to the streamed audio flow
     if st.session_state["allow_youtube_captions"]:
         with st.spinner("Retrieving transcript for video from YouTube..."):
-            transcript = get_transcript(video_id, "youtube")
+            try:
+                transcript = get_transcript(
+                    video_id, "youtube", on_queued=show_queue_position, video_seconds=video_seconds, timeout=MAX_POLL_TIME
+                )
+            except QueueFullError as e:
+                logging.warning(f"Caption queue rejected video {video_id}, ETA {e.eta}s")
             if transcript:
                 from_captions = True
 
     # Fall back to audio processing if needed
     if not transcript:
-        transcript = transcript_creation_flow(video_id)
+        transcript = transcript_creation_flow(video_id, video_seconds)
         
     elapsed_time = time.time() - start_time
     
@@ -580,6 +669,8 @@ def main():
     
     render_header()
     check_worker_status()
+    if SHOW_CACHE_ADMIN:
+        render_cache_admin()
     
     # Render input controls and get selected flow
     clickbait_active, bias_active, custom_active, context_active, any_button_clicked = render_input_controls()
@@ -597,13 +688,13 @@ def main():
         return
 
     # Validate video
-    is_valid, video_id = validate_video(video_url)
+    is_valid, video_id, video_seconds = validate_video(video_url)
     if not is_valid:
         sync_query_params()
         return
         
     # Get transcript
-    transcript, transcript_elapsed_time, from_captions = get_video_transcript(video_id)
+    transcript, transcript_elapsed_time, from_captions = get_video_transcript(video_id, video_seconds)
     if not transcript:
         st.error("Transcript creation failed.")
         sync_query_params()
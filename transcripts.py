@@ -2,17 +2,60 @@
 
 import logging
 import time
-import json
-from typing import Optional
+from collections import deque
+from typing import Callable, Dict, Generator, List, Optional, Tuple
 
-from redis_wrapper import value_cache as r, QUEUE_NAME
+from redis_wrapper import value_cache as r, pubsub_cache, WORKER_REGISTRY, decode_value, live_workers, queue_for_task, server_time, transcript_events_channel
+from job_queue import (
+    enqueue_unique_job,
+    estimate_job_seconds,
+    job_stats_key,
+    parse_job_stats,
+    partial_transcript_key,
+    status_key,
+    transcript_key
+)
 
 # Adjust these as desired
-POLL_INTERVAL = 0.5      # seconds between polls
-MAX_POLL_TIME = 60.0     # max seconds to wait for the transcript
-MAX_JOBS_IN_FLIGHT = 5   # max queued or in_progress jobs allowed
+POLL_INTERVAL = 0.5      # seconds between polls (only used when pub/sub is unavailable)
+MAX_POLL_TIME = 60.0     # max seconds to wait for the transcript of a short video
+WAIT_PER_VIDEO_SECOND = 0.25  # extra seconds of waiting per second of video, as Whisper time grows with length
+MAX_JOBS_IN_FLIGHT = {   # hard cap on queued or in_progress jobs, per queue lane
+    "youtube": 50,       # admission is normally decided by the ETA check, not this cap
+    "audio": 20,
+}
+DEFAULT_WORKER_SLOTS = 1  # assumed job slots when no worker has advertised any
+BULK_BATCH_SIZE = 10      # jobs a bulk request keeps queued at once, well under the caps above
+BULK_BATCH_TIMEOUT = 30 * 60  # admission deadline and wait limit for each bulk batch
+BULK_MAX_REJECTIONS = 10  # consecutive times a full queue turns a batch away before giving up
+EVENT_RECHECK_INTERVAL = 10.0  # re-read Redis at least this often while waiting on events
 
-def get_transcript(video_id: str, task_type: str):
+class QueueFullError(RuntimeError):
+    """
+    Raised when a transcript job can't be admitted: the lane is at its hard cap or the
+    job wouldn't complete within the caller's deadline. eta is the
+    projected seconds until the job would complete if it were queued now, and video_ids
+    are the videos that were turned away.
+    """
+    def __init__(self, message: str, eta: Optional[float] = None, video_ids: Optional[List[str]] = None):
+        super().__init__(message)
+        self.eta = eta
+        self.video_ids = video_ids or []
+
+def transcript_timeout(video_seconds: Optional[float] = None) -> float:
+    """
+    Seconds to wait for a transcript, and the admission deadline for its job: longer
+    videos take longer to transcribe, so they get a proportionally longer wait.
+    """
+    return MAX_POLL_TIME + WAIT_PER_VIDEO_SECOND * (video_seconds or 0)
+
+def get_transcript(
+    video_id: str,
+    task_type: str,
+    on_queued: Optional[Callable[[str, int, int], None]] = None,
+    video_seconds: Optional[float] = None,
+    timeout: Optional[float] = None
+):
     """
     Steps:
       1) Check if we have an audio transcript in Redis. Return it if found.
@@ -20,76 +63,386 @@ def get_transcript(video_id: str, task_type: str):
       3) Otherwise, we look at transcript_status:{task_type}:{video_id}.
          - If status is 'failed', let's re-queue since user is making a fresh request.
          - If no status or status in ('failed', 'queued', 'in_progress'), we queue a job or confirm it's queued.
-      4) Poll for result, or see if it fails quickly.
-    """
-
-    # 1) Check for existing audio transcript
-    audio_key = f"transcript:audio:{video_id}"
-    audio_data = r.get(audio_key)
-    if audio_data:
-        logging.info(f"[User] Found existing audio transcript in cache for video ID: {video_id}.")
-        return audio_data
-
-    # 2) Check for existing youtube transcript
-    youtube_key = f"transcript:youtube:{video_id}"
-    youtube_data = r.get(youtube_key)
-    if youtube_data:
-        logging.info(f"[User] Found existing youtube transcript in cache for video ID: {video_id}.")
-        return youtube_data
-
-    # 3) If we still have no transcript, check the job status
-    status_key = f"transcript_status:{task_type}:{video_id}"
-    status_val = r.get(status_key)
-
-    # If the user wants to request again, but the status is 'failed', let's re-queue
-    if status_val == "failed":
-        logging.warning(f"[User] Found previous 'failed' status. Attempting a fresh queue for video: {video_id}")
-        status_val = None  # treat it like it’s never been queued
-        # We intentionally do NOT delete the status key here, but will overwrite below
-
-    if not status_val or status_val in ("failed", "queued", "in_progress"):
-        # If we haven't queued or are forced to re-queue from previous 'failed'
-        # limit queue length so we don’t blow up
-        jobs_in_queue = r.llen(QUEUE_NAME)
-        if jobs_in_queue >= MAX_JOBS_IN_FLIGHT:
-            logging.error(f"[User] Too many jobs in the queue ({jobs_in_queue}). Rejecting new job.")
-            raise RuntimeError("Transcript queue is full. Please try again later.")
-
-        if not status_val or status_val == "failed":
-            # Mark job as queued
-            r.set(status_key, "queued", ex=60 * 60)
-
-            job_payload = {
-                "video_id": video_id,
-                "task_type": task_type
-            }
-            r.rpush(QUEUE_NAME, json.dumps(job_payload))
-            logging.info(f"[User] Enqueued job for video ID: {video_id}, task type: {task_type}.")
-
-    # 4) Poll for transcript or 'failed'
-    start_time = time.time()
-    while True:
-        # Re-check both possible transcripts
-        audio_data = r.get(audio_key)
-        if audio_data:
-            logging.info(f"[User] Returning fallback audio transcript for video ID: {video_id}")
-            return audio_data
-
-        youtube_data = r.get(youtube_key)
-        if youtube_data:
-            logging.info(f"[User] Returning fallback youtube transcript for video ID: {video_id}")
-            return youtube_data
-
-        # Also check if the worker signaled 'failed'
-        current_status = r.get(status_key)
-        if current_status == "failed":
+      4) Wait for the worker's completion event (polling if notifications are unavailable).
+
+    Single-video form of get_transcripts; all three cache probes go out in one MGET.
+    timeout defaults to transcript_timeout(video_seconds).
+    """
+    video_durations = {video_id: video_seconds} if video_seconds else None
+    return get_transcripts([video_id], task_type, timeout=timeout, on_queued=on_queued, video_durations=video_durations)[video_id]
+
+def get_transcripts(
+    video_ids: List[str],
+    task_type: str,
+    timeout: Optional[float] = None,
+    on_queued: Optional[Callable[[str, int, int], None]] = None,
+    video_durations: Optional[Dict[str, float]] = None,
+    on_rejected: Optional[Callable[[str, int], None]] = None
+) -> Dict[str, Optional[str]]:
+    """
+    Resolve transcripts for many videos at once.
+
+    All cache probes (audio, youtube and status keys for every video) are issued as a
+    single MGET, every miss is enqueued in one pipeline, and the outstanding jobs are
+    awaited together. Each enqueue is an atomic server-side script, so concurrent
+    sessions asking for the same video never queue it twice.
+
+    Admission is based on estimated completion time: a job is only queued if the work
+    ahead of it plus its own run (learned from recorded job durations) would finish
+    within timeout, which grows with the video's length by default. Videos that aren't
+    admitted come back as None and are reported to on_rejected; only if none of the
+    videos was cached or admitted is a QueueFullError carrying the shortest ETA raised.
+
+    :param video_ids: The YouTube video IDs. Duplicates are resolved once.
+    :param task_type: 'audio' or 'youtube', the preferred transcription method.
+    :param timeout: Max seconds to wait for the worker across all videos. This is also
+                    the deadline used for admission. Defaults to transcript_timeout of
+                    the longest video.
+    :param on_queued: Called with (video_id, position, eta) for every video waiting on the
+                      worker. position is 1-based and counts jobs in progress, 0 if unknown.
+                      eta is the projected seconds until the transcript is ready.
+    :param video_durations: Video durations in seconds, by video ID, for better estimates.
+    :param on_rejected: Called with (video_id, eta) for every video the queue turned away.
+    :return: Dict of video ID to transcript, or None if it failed, timed out or wasn't admitted.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    if timeout is None:
+        timeout = transcript_timeout(max((video_durations or {}).values(), default=None))
+    results, waiting, rejected = _request_transcripts(video_ids, task_type, timeout, on_queued, video_durations)
+    if rejected and not results and not waiting:
+        raise _queue_full(rejected, task_type, timeout)
+    if on_rejected:
+        for video_id, eta in rejected.items():
+            on_rejected(video_id, eta)
+
+    # 4) Wait for the worker to publish results, or see if they fail quickly
+    if waiting:
+        results.update(_wait_for_transcripts(waiting, task_type, timeout))
+    return {video_id: results.get(video_id) for video_id in video_ids}
+
+def stream_transcript(
+    video_id: str,
+    task_type: str,
+    on_queued: Optional[Callable[[str, int, int], None]] = None,
+    video_seconds: Optional[float] = None,
+    timeout: Optional[float] = None
+) -> Generator[Tuple[str, bool], None, None]:
+    """
+    Generator form of get_transcript. While the worker is still transcribing a long
+    video, yields (partial_transcript, False) every time it appends a finished segment,
+    then yields (transcript, True) once the full transcript is stored. Yields nothing
+    further if the job fails or times out, so callers should only treat a final
+    transcript as complete. timeout defaults to transcript_timeout(video_seconds).
+    """
+    video_durations = {video_id: video_seconds} if video_seconds else None
+    if timeout is None:
+        timeout = transcript_timeout(video_seconds)
+    results, waiting, rejected = _request_transcripts([video_id], task_type, timeout, on_queued, video_durations)
+    if rejected:
+        raise _queue_full(rejected, task_type, timeout)
+    if not waiting:
+        if results.get(video_id):
+            yield results[video_id], True
+        return
+
+    deadline = time.time() + timeout
+    partial_key = partial_transcript_key(video_id)
+    partial_text = ""
+    last_id = None
+    try:
+        pubsub = pubsub_cache.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(transcript_events_channel(video_id))
+    except Exception as e:
+        logging.warning(f"[User] Transcript notifications unavailable, falling back to polling: {e}")
+        pubsub = None
+
+    try:
+        pending = [video_id]
+        while True:
+            # Segments appended since the last read, exclusive of the last one seen
+            updated = False
+            for entry_id, fields in r.xrange(partial_key, min=f"({last_id}" if last_id else "-"):
+                last_id = entry_id
+                if "attempt" in fields:
+                    # The worker started over, so earlier segments are void
+                    partial_text = ""
+                else:
+                    partial_text = f"{partial_text} {fields['text']}".strip()
+                updated = True
+            if updated and partial_text:
+                yield partial_text, False
+
+            finished: Dict[str, Optional[str]] = {}
+            _collect_finished(pending, task_type, finished, waiting)
+            if not pending:
+                if finished.get(video_id):
+                    yield finished[video_id], True
+                return
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logging.warning(f"[User] Timed out streaming transcript for video ID: {video_id}")
+                return
+
+            if pubsub is not None:
+                pubsub.get_message(timeout=min(remaining, EVENT_RECHECK_INTERVAL))
+            else:
+                time.sleep(POLL_INTERVAL)
+    finally:
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+def get_cached_transcripts(video_ids: List[str], task_type: str) -> Dict[str, Optional[str]]:
+    """
+    Cached transcripts for many videos in one MGET, without enqueueing anything.
+
+    :return: Dict of video ID to transcript, or None if it isn't cached.
+    """
+    if not video_ids:
+        return {}
+    return {video_id: transcript for video_id, (transcript, _) in _probe_transcripts(video_ids, task_type).items()}
+
+def iter_transcripts(
+    video_ids: List[str],
+    task_type: str,
+    batch_size: int = BULK_BATCH_SIZE,
+    timeout: float = BULK_BATCH_TIMEOUT
+) -> Generator[Tuple[str, Optional[str]], None, None]:
+    """
+    Resolves transcripts for a long list of videos without flooding the queue: videos
+    are requested batch_size at a time, and the next batch is only enqueued once the
+    previous one has finished, so interactive requests keep getting admitted.
+
+    Videos the queue turns away are retried in a later batch. If a whole batch is
+    turned away, this waits for the queue's shortest ETA and tries again, up to
+    BULK_MAX_REJECTIONS times in a row before raising QueueFullError.
+
+    :return: Yields (video_id, transcript or None if it failed) as batches finish.
+    """
+    pending = deque(dict.fromkeys(video_ids))
+    rejections = 0
+    while pending:
+        batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+        results, waiting, rejected = _request_transcripts(batch, task_type, timeout, None, None)
+        if rejected and not results and not waiting:
+            rejections += 1
+            if rejections >= BULK_MAX_REJECTIONS:
+                raise _queue_full(rejected, task_type, timeout)
+            pending.extendleft(reversed(batch))
+            backoff = min(max(min(rejected.values()), POLL_INTERVAL), timeout)
+            logging.warning(f"[User] Queue is full, retrying {len(pending)} bulk video(s) in {backoff:.0f}s")
+            time.sleep(backoff)
+            continue
+        rejections = 0
+
+        for video_id, transcript in results.items():
+            yield video_id, transcript
+        # Not admitted this time around
+        pending.extend(rejected)
+        if waiting:
+            finished = _wait_for_transcripts(waiting, task_type, timeout)
+            for video_id in waiting:
+                yield video_id, finished.get(video_id)
+
+def _request_transcripts(
+    video_ids: List[str],
+    task_type: str,
+    timeout: float,
+    on_queued: Optional[Callable[[str, int, int], None]],
+    video_durations: Optional[Dict[str, float]]
+) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, int]]:
+    """
+    Steps 1-3 of get_transcripts: returns the transcripts already cached, the videos now
+    waiting on the worker, and the videos the queue turned away with their ETAs.
+    Waiting videos map to the task type whose status key tracks their job, which is
+    another task type's when the job joined one for the same video and method.
+    """
+    results: Dict[str, str] = {}
+    rejected: Dict[str, int] = {}
+    waiting: Dict[str, str] = {}
+    if not video_ids:
+        return results, waiting, rejected
+
+    # 1-3) Probe every cache and status key in one round trip
+    states = _probe_transcripts(video_ids, task_type)
+    misses = []
+    for video_id in video_ids:
+        transcript, status_val = states[video_id]
+        if transcript:
+            logging.info(f"[User] Found existing transcript in cache for video ID: {video_id}.")
+            results[video_id] = transcript
+            continue
+
+        # If the user wants to request again, but the status is 'failed', the enqueue script re-queues it
+        if status_val == "failed":
+            logging.warning(f"[User] Found previous 'failed' status. Attempting a fresh queue for video: {video_id}")
+        misses.append(video_id)
+
+    if misses:
+        outcomes = _enqueue_jobs(misses, task_type, timeout, video_durations or {})
+        for video_id in misses:
+            outcome, position, eta, job_type = outcomes[video_id]
+            if outcome in ("full", "late"):
+                logging.warning(f"[User] Not enqueueing video ID: {video_id} ({outcome}, ETA {eta}s)")
+                rejected[video_id] = eta
+                continue
+            waiting[video_id] = job_type
+            if on_queued and outcome in ("queued", "duplicate"):
+                on_queued(video_id, position, eta)
+    return results, waiting, rejected
+
+def _queue_full(rejected: Dict[str, int], task_type: str, timeout: float) -> QueueFullError:
+    eta = min(rejected.values())
+    logging.error(f"[User] {queue_for_task(task_type)} can't take new job(s) within {timeout}s, ETA {eta}s. Rejecting.")
+    return QueueFullError("Transcript queue is full. Please try again later.", eta=eta, video_ids=list(rejected))
+
+def _probe_transcripts(
+    video_ids: List[str],
+    task_type: str,
+    job_types: Optional[Dict[str, str]] = None
+) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    Reads the audio transcript, youtube transcript and job status of every video in a
+    single MGET. The audio transcript is preferred when both exist.
+
+    :param job_types: Task type whose status to read, by video ID, where it isn't task_type.
+    :return: Dict of video ID to (transcript, status).
+    """
+    n = len(video_ids)
+    job_types = job_types or {}
+    keys = (
+        [transcript_key("audio", video_id) for video_id in video_ids]
+        + [transcript_key("youtube", video_id) for video_id in video_ids]
+        + [status_key(job_types.get(video_id, task_type), video_id) for video_id in video_ids]
+    )
+    values = r.mget(keys)
+    return {
+        video_id: (decode_value(values[i] or values[n + i]), values[2 * n + i])
+        for i, video_id in enumerate(video_ids)
+    }
+
+def _enqueue_jobs(video_ids: List[str], task_type: str, deadline: float, video_durations: Dict[str, float]) -> Dict[str, Tuple[str, int, int]]:
+    """
+    Runs the atomic enqueue script for every video, all in one pipeline. Each lane is
+    admitted on its own so a backlog of Whisper jobs doesn't block cheap caption fetches.
+
+    :return: Dict of video ID to (outcome, position, eta, task_type), see job_queue.enqueue_unique_job.
+    """
+    lane = queue_for_task(task_type)
+    # Recent job durations and the live workers' advertised capacity, in one round trip
+    pipe = r.pipeline(transaction=False)
+    pipe.lrange(job_stats_key(lane), 0, -1)
+    pipe.hgetall(WORKER_REGISTRY)
+    pipe.time()
+    raw_samples, registry, now = pipe.execute()
+    samples = parse_job_stats(raw_samples)
+    slots = sum(info.get("capacity", 0) for info in live_workers(registry, server_time(now)).values()) or DEFAULT_WORKER_SLOTS
+
+    max_jobs = MAX_JOBS_IN_FLIGHT.get(task_type, MAX_JOBS_IN_FLIGHT["audio"])
+    pipe = r.pipeline(transaction=False)
+    for video_id in video_ids:
+        video_seconds = video_durations.get(video_id)
+        job_payload = {
+            "video_id": video_id,
+            "task_type": task_type,
+            "video_seconds": video_seconds,
+            "estimate": round(estimate_job_seconds(lane, video_seconds, samples), 1),
+            "enqueued_at": time.time()
+        }
+        enqueue_unique_job(job_payload, max_jobs, deadline, estimate_job_seconds(lane, samples=samples), slots, client=pipe)
+    outcomes = {video_id: tuple(result) for video_id, result in zip(video_ids, pipe.execute())}
+
+    for video_id, (outcome, position, eta, _) in outcomes.items():
+        if outcome == "queued":
+            logging.info(f"[User] Enqueued job for video ID: {video_id}, task type: {task_type}, position: {position}, ETA: {eta}s.")
+        elif outcome == "duplicate":
+            logging.info(f"[User] Job already queued for video ID: {video_id}, position: {position}, ETA: {eta}s.")
+    return outcomes
+
+def _collect_finished(
+    pending: List[str],
+    task_type: str,
+    results: Dict[str, Optional[str]],
+    job_types: Optional[Dict[str, str]] = None
+):
+    """
+    Moves every pending video whose transcript landed, or whose job failed, into results.
+
+    :param job_types: Task type of the job each video waits on, where it isn't task_type.
+    """
+    for video_id, (transcript, status_val) in _probe_transcripts(pending, task_type, job_types).items():
+        if transcript:
+            logging.info(f"[User] Returning transcript for video ID: {video_id}")
+            results[video_id] = transcript
+        elif status_val == "failed":
             logging.warning(f"[User] Worker indicated transcript generation FAILED for video: {video_id}")
             # Return None so that the caller can display a quick error
-            return None
+            results[video_id] = None
+    pending[:] = [video_id for video_id in pending if video_id not in results]
+
+def _wait_for_transcripts(waiting: Dict[str, str], task_type: str, timeout: float = MAX_POLL_TIME) -> Dict[str, Optional[str]]:
+    """
+    Blocks on the worker's pub/sub completion events instead of polling. Redis is
+    re-checked after subscribing (so an event published just before we subscribed
+    isn't missed), after every event, and every EVENT_RECHECK_INTERVAL seconds.
+    Falls back to polling if pub/sub can't be used.
+
+    :param waiting: Video IDs to wait for, mapped to the task type of the job that
+                    will produce each, as returned by _request_transcripts.
+    """
+    deadline = time.time() + timeout
+    results: Dict[str, Optional[str]] = {}
+    pending = list(waiting)
+    try:
+        pubsub = pubsub_cache.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*[transcript_events_channel(video_id) for video_id in pending])
+    except Exception as e:
+        logging.warning(f"[User] Transcript notifications unavailable, falling back to polling: {e}")
+        return _poll_for_transcripts(pending, task_type, deadline, results, waiting)
+
+    try:
+        while True:
+            _collect_finished(pending, task_type, results, waiting)
+            if not pending:
+                return results
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logging.warning(f"[User] Timed out waiting for transcripts for video IDs: {pending}")
+                return results
+
+            message = pubsub.get_message(timeout=min(remaining, EVENT_RECHECK_INTERVAL))
+            if message:
+                logging.info(f"[User] Received transcript event on {message['channel']}: {message['data']}")
+    except Exception as e:
+        logging.warning(f"[User] Lost transcript notifications, falling back to polling: {e}")
+        return _poll_for_transcripts(pending, task_type, deadline, results, waiting)
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+def _poll_for_transcripts(
+    pending: List[str],
+    task_type: str,
+    deadline: float,
+    results: Dict[str, Optional[str]],
+    job_types: Optional[Dict[str, str]] = None
+) -> Dict[str, Optional[str]]:
+    """
+    Poll for transcripts or 'failed' until all are done or the deadline passes.
+    """
+    while True:
+        _collect_finished(pending, task_type, results, job_types)
+        if not pending:
+            return results
 
-        elapsed = time.time() - start_time
-        if elapsed > MAX_POLL_TIME:
-            logging.warning(f"[User] Timed out waiting for transcript for video ID: {video_id}")
-            return None
+        if time.time() > deadline:
+            logging.warning(f"[User] Timed out waiting for transcripts for video IDs: {pending}")
+            return results
 
         time.sleep(POLL_INTERVAL)
@@ -4,53 +4,245 @@ from isodate import parse_duration
 import logging
 import os
 import requests
+import shutil
+import subprocess
+import threading
+import time
+from typing import Generator, List, Optional, Tuple
 
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadCancelled
 
+import audio_cache
 from helpers import *
+from metrics import StageTimings
 
-def download_video_mp3(video_id: str):
-    """
-    Download a video's audio as an MP3 file and stores it in cached_audio folder,
-    downsampled to 16,000Hz mono.
-    """
-    # Skip if already downloaded
-    if os.path.exists(to_audio_location(video_id)):
-        print(f"Video audio cached, no download performed for video ID: {video_id}")
-        return 
-
-    video_url = to_video_url(video_id)
-
-    # Create the audio folder if it isn't made yet
-    if not os.path.exists(cached_audio_folder):
-        os.makedirs(cached_audio_folder)
-        print(f"Folder '{cached_audio_folder}' created.")
+# How audio is acquired for transcription:
+#   "native"   - smallest acceptable native audio stream (opus/webm or m4a), no FFmpeg at all
+#   "remux"    - native stream copied into an audio-only container, no re-encoding
+#   "resample" - native stream re-encoded to low bitrate 16kHz mono Opus in Ogg, cheaper than MP3
+# Opus output is stored as .ogg: the transcription backend accepts Ogg but not .opus.
+#   "mp3"      - bestaudio re-encoded to 64kbps 16kHz mono MP3 (the original behaviour)
+AUDIO_MODE = os.environ.get("AUDIO_MODE", "native")
 
-    filename = os.path.join(cached_audio_folder, video_id)
+# Formats the transcription backend accepts without conversion, smallest first. Streams
+# below 32kbps are skipped unless nothing else exists, to keep speech intelligible.
+NATIVE_AUDIO_FORMAT = (
+    "worstaudio[ext=webm][abr>=32]/worstaudio[ext=m4a][abr>=32]/"
+    "worstaudio[ext=webm]/worstaudio[ext=m4a]/bestaudio/best"
+)
 
+def audio_download_options(mode: str, filename: str) -> dict:
+    """
+    yt-dlp options for an audio acquisition mode (see AUDIO_MODE).
+    """
     # Settings for yt-dlp (verbose to view PO token status)
     ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': filename,
-        'postprocessors': [
+        'format': NATIVE_AUDIO_FORMAT,
+        'outtmpl': filename + '.%(ext)s',
+        'verbose': True,  # Enable verbose logging to see PO token usage
+    }
+    if mode == "remux":
+        # 'best' keeps the source codec, so FFmpeg only copies the stream
+        ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}]
+    elif mode == "resample":
+        ydl_opts['postprocessors'] = [
+            {'key': 'FFmpegExtractAudio', 'preferredcodec': 'opus', 'preferredquality': '24'}
+        ]
+        ydl_opts['postprocessor_args'] = ['-ar', '16000', '-ac', '1']
+    elif mode == "mp3":
+        ydl_opts['format'] = 'bestaudio/best'
+        ydl_opts['outtmpl'] = filename
+        ydl_opts['postprocessors'] = [
             {
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
                 'preferredquality': '64',
             }
-        ],
-        'postprocessor_args': [
+        ]
+        ydl_opts['postprocessor_args'] = [
             '-ar', '16000',  # Set audio sample rate to 16,000Hz
             '-ac', '1'       # Set audio channels to mono
-        ],
-        'verbose': True,  # Enable verbose logging to see PO token usage
-    }
+        ]
+    elif mode != "native":
+        raise ValueError(f"Unknown audio mode: {mode}")
+    return ydl_opts
 
+def cancel_hook(cancel_event: threading.Event):
+    """
+    A yt-dlp progress hook that aborts the download once cancel_event is set.
+    """
+    def hook(progress: dict):
+        if cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled")
+    return hook
+
+def download_video_audio(
+    video_id: str,
+    mode: str = AUDIO_MODE,
+    cancel_event: Optional[threading.Event] = None,
+    timings: Optional[StageTimings] = None
+) -> str:
+    """
+    Download a video's audio into the cached_audio folder using the given acquisition
+    mode, skipping the download if audio for the video is already cached.
+
+    :param cancel_event: Setting it aborts the download with DownloadCancelled.
+    :param timings: Receives the time spent downloading and in the FFmpeg postprocessor.
+    :return: Path to the audio file.
+    """
+    # Skip if already downloaded
+    cached_path = audio_cache.lookup(video_id)
+    if cached_path:
+        print(f"Video audio cached, no download performed for video ID: {video_id}")
+        return cached_path
+
+    with audio_cache.download_lock(video_id):
+        # Another job may have downloaded it while this one waited
+        cached_path = audio_cache.lookup(video_id)
+        if cached_path:
+            print(f"Video audio cached, no download performed for video ID: {video_id}")
+            return cached_path
+
+        # Download into a private folder and move the result into the cache in one step,
+        # so concurrent jobs never see a partial file
+        temp_dir = audio_cache.make_temp_dir()
+        try:
+            temp_path = _download_audio_to(temp_dir, video_id, mode, cancel_event, timings)
+            file_path = audio_cache.commit(temp_path, video_id)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    audio_cache.evict(keep=[file_path])
+    print(f"Audio download complete ({mode}): {file_path}")
+    return file_path
+
+def _download_audio_to(
+    folder: str,
+    video_id: str,
+    mode: str,
+    cancel_event: Optional[threading.Event],
+    timings: Optional[StageTimings]
+) -> str:
+    """
+    Runs yt-dlp for download_video_audio, writing into folder.
+
+    :return: Path of the audio file produced.
+    """
+    ydl_opts = audio_download_options(mode, os.path.join(folder, video_id))
+    progress_hooks = []
+    if cancel_event:
+        progress_hooks.append(cancel_hook(cancel_event))
+    downloaded_at = []
+    if timings:
+        # Everything after the last download finishes is postprocessing
+        def record_download(progress: dict):
+            if progress['status'] == 'finished':
+                downloaded_at.append(time.perf_counter())
+        progress_hooks.append(record_download)
+    if progress_hooks:
+        ydl_opts['progress_hooks'] = progress_hooks
+
+    start_time = time.perf_counter()
     # TODO: Likely need error handling here
     with YoutubeDL(ydl_opts) as ydl:
-        ydl.download([video_url])
+        ydl.download([to_video_url(video_id)])
+    if timings:
+        end_time = time.perf_counter()
+        download_end = downloaded_at[-1] if downloaded_at else end_time
+        timings.add("download", download_end - start_time)
+        if end_time > download_end:
+            timings.add("transcode", end_time - download_end)
+
+    # FFmpegExtractAudio names Opus output .opus, but the file is already Ogg Opus
+    opus_path = os.path.join(folder, f"{video_id}.opus")
+    if os.path.exists(opus_path):
+        os.replace(opus_path, os.path.join(folder, f"{video_id}.ogg"))
+
+    for ext in AUDIO_EXTENSIONS:
+        path = os.path.join(folder, f"{video_id}.{ext}")
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"Audio download produced no file for video ID: {video_id}")
+
+# Where downloaded audio goes before transcription: "file" writes it to cached_audio,
+# "memory" pipes FFmpeg's output straight into a buffer (no temp file on disk)
+AUDIO_HANDOFF = os.environ.get("AUDIO_HANDOFF", "file")
+FFMPEG_TIMEOUT = 15 * 60
+
+def ffmpeg_pipe_args(mode: str, source_codec: str) -> Tuple[list, str]:
+    """
+    FFmpeg output arguments that write a mode's audio to stdout. Containers are chosen
+    so they can be written to a pipe, which rules out (non-fragmented) m4a.
+
+    :return: (output arguments, file extension)
+    """
+    if mode == "mp3":
+        return ['-c:a', 'libmp3lame', '-b:a', '64k', '-ar', '16000', '-ac', '1', '-f', 'mp3'], "mp3"
+    if mode in ("native", "remux") and source_codec == "opus":
+        return ['-c:a', 'copy', '-f', 'ogg'], "ogg"
+    # "resample", or a native stream that can't be copied into a pipeable container
+    return ['-c:a', 'libopus', '-b:a', '24k', '-ar', '16000', '-ac', '1', '-f', 'ogg'], "ogg"
+
+def fetch_video_audio_bytes(
+    video_id: str,
+    mode: str = AUDIO_MODE,
+    cancel_event: Optional[threading.Event] = None,
+    timings: Optional[StageTimings] = None
+) -> Tuple[str, bytes, float]:
+    """
+    Fetch a video's audio into memory: yt-dlp resolves the stream URL and FFmpeg reads it
+    and writes the mode's output format to a pipe.
+
+    :param cancel_event: Setting it kills FFmpeg and raises DownloadCancelled.
+    :param timings: Receives the fetch time. FFmpeg transcodes while it downloads, so
+                    it all counts as download.
+    :return: (filename for the transcription upload, audio bytes, duration in seconds)
+    """
+    start_time = time.perf_counter()
+    ydl_opts = audio_download_options(mode, os.path.join(cached_audio_folder, video_id))
+    ydl_opts.pop('postprocessors', None)
+    ydl_opts.pop('postprocessor_args', None)
+    with YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(to_video_url(video_id), download=False)
 
-    print("Audio download complete: {}".format(to_audio_location(video_id)))
+    # Single-format selections put the stream on the info dict itself
+    stream = (info.get('requested_formats') or [info])[0]
+    headers = "".join(f"{key}: {value}\r\n" for key, value in (stream.get('http_headers') or {}).items())
+    output_args, ext = ffmpeg_pipe_args(mode, stream.get('acodec') or "")
+
+    command = ['ffmpeg', '-v', 'error']
+    if headers:
+        command += ['-headers', headers]
+    command += ['-i', stream['url'], '-vn'] + output_args + ['pipe:1']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    waited = 0
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=1)
+            break
+        except subprocess.TimeoutExpired:
+            waited += 1
+            if (cancel_event and cancel_event.is_set()) or waited >= FFMPEG_TIMEOUT:
+                process.kill()
+                process.communicate()
+                if waited >= FFMPEG_TIMEOUT:
+                    raise
+                raise DownloadCancelled("Download cancelled")
+    if process.returncode != 0 or not stdout:
+        raise RuntimeError(f"FFmpeg failed for video ID {video_id}: {stderr.decode(errors='replace')[-500:]}")
+
+    if timings:
+        timings.add("download", time.perf_counter() - start_time)
+    print(f"Audio fetched into memory ({mode}, {len(stdout) / (1024 * 1024):.2f} MB) for video ID: {video_id}")
+    return f"{video_id}.{ext}", stdout, float(info.get('duration') or 0.0)
+
+def download_video_mp3(video_id: str):
+    """
+    Download a video's audio as an MP3 file and stores it in cached_audio folder,
+    downsampled to 16,000Hz mono.
+    """
+    download_video_audio(video_id, mode="mp3")
 
 def delete_video_mp3(video_id: str):
     if not os.path.exists(to_audio_location(video_id)):
@@ -58,40 +250,83 @@ def delete_video_mp3(video_id: str):
         return 
     os.remove(to_audio_location(video_id))
 
-def get_most_recent_video(channel_id: str):
+def get_channel_feed(channel_id: str, etag: Optional[str] = None, modified: Optional[str] = None):
+    """
+    Fetch a channel's uploads RSS feed (its 15 most recent videos). Pass the etag and
+    modified values of the previous fetch to make a conditional request; if the feed
+    hasn't changed, the result has status 304 and no entries.
+    """
     feed_url = 'https://www.youtube.com/feeds/videos.xml?channel_id=' + channel_id
+    return feedparser.parse(feed_url, etag=etag, modified=modified)
 
-    feed = feedparser.parse(feed_url)
+def get_most_recent_video(channel_id: str):
+    feed = get_channel_feed(channel_id)
     
     most_recent_video = feed.entries[0]
     return most_recent_video
 
 
-def get_video_ids(channel_id, n):
-    """
-    Takes Channel ID and number of videos as input.
-    Outputs a list of video IDs.
-    """
-    # Get the uploads playlist ID for the channel
+def get_uploads_playlist_id(channel_id: str) -> str:
     channel_content = youtube.channels().list(
         part="contentDetails",
         id=channel_id
     ).execute()
-    # print(channel_content)
-    print(channel_content)
-    uploads_playlist_id = channel_content["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
-
-    # Fetch the most recent `n` video IDs
-    videos = youtube.playlistItems().list(
-        part="snippet",
-        playlistId=uploads_playlist_id,
-        maxResults=n,
-    ).execute()
-    # print(videos)
+    if not channel_content.get("items"):
+        raise ValueError(f"Channel not found: {channel_id}")
+    return channel_content["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
 
-    video_ids = [video["snippet"]["resourceId"]["videoId"]
-                 for video in videos["items"]]
-    return video_ids
+def iter_channel_uploads(
+    channel_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = 50
+) -> Generator[List[Tuple[str, str]], None, None]:
+    """
+    Pages through a channel's uploads playlist, newest first, one API call per page.
+    The uploads playlist is in upload order, so paging stops at the first page that
+    is entirely older than start_date.
+
+    :param start_date: Only uploads published on or after this mm/dd/yyyy date.
+    :param end_date: Only uploads published before this mm/dd/yyyy date.
+    :return: Yields a list of (video_id, published_at) for each page, after filtering.
+    """
+    published_after = convert_date(start_date)
+    published_before = convert_date(end_date)
+
+    request = youtube.playlistItems().list(
+        part="contentDetails",
+        playlistId=get_uploads_playlist_id(channel_id),
+        maxResults=page_size
+    )
+    while request is not None:
+        response = request.execute()
+        uploads = [
+            (item["contentDetails"]["videoId"], item["contentDetails"].get("videoPublishedAt", ""))
+            for item in response.get("items", [])
+        ]
+        # ISO 8601 timestamps in UTC compare correctly as strings
+        page = [
+            (video_id, published_at) for video_id, published_at in uploads
+            if (not published_after or published_at >= published_after)
+            and (not published_before or published_at < published_before)
+        ]
+        if page:
+            yield page
+        if published_after and uploads and all(published_at < published_after for _, published_at in uploads):
+            return
+        request = youtube.playlistItems().list_next(request, response)
+
+def get_video_ids(channel_id, n):
+    """
+    Takes Channel ID and number of videos as input.
+    Outputs a list of the most recent video IDs, at most n.
+    """
+    video_ids = []
+    for page in iter_channel_uploads(channel_id, page_size=min(max(n, 1), 50)):
+        video_ids.extend(video_id for video_id, _ in page)
+        if len(video_ids) >= n:
+            break
+    return video_ids[:n]
 
 
 class VideoInfo:
@@ -100,46 +335,32 @@ class VideoInfo:
         self.transcript = transcript
 
 
-# TODO: Re-enable using the new worker paradigm
-# def get_videos(channel, max_results=15, start_date=None, end_date=None, require_handmade=True):
-#     id = get_channel_id_from_username(
-#         channel) if not "youtube.com" in channel else get_channel_id_locally(channel)
-
-#     channel_videos_request = youtube.search().list(
-#         part="snippet",
-#         channelId=id,
-#         type="video",
-#         maxResults=max_results,
-#         order="date",
-#         publishedAfter=convert_date(start_date),
-#         publishedBefore=convert_date(end_date)
-#     )
-
-#     video_ids = []
-#     missed_videos = 0
-
-#     while channel_videos_request and len(video_ids) < max_results:
-#         response = channel_videos_request.execute()
-#         for item in response['items']:
-#             id = item['id']['videoId']
-#             try:
-#                 transcript_text = get_youtube_str_transcript(id)
-#                 video_ids.append(VideoInfo(id, transcript_text))
-
-#             except Exception as e:
-#                 # print(e)
-#                 print(
-#                     "Skipping video: {} due to no manually created transcripts", to_video_url(id))
-#                 missed_videos += 1
-#                 continue
-
-#         if 'nextPageToken' in response:
-#             channel_videos_request = youtube.search().list_next(
-#                 channel_videos_request, response)
-#         else:
-#             channel_videos_request = None
-#     print("Skipped {} videos due to no manually created transcripts".format(missed_videos))
-#     return video_ids
+def resolve_channel_id(channel: str) -> Optional[str]:
+    """
+    Channel ID from a channel URL, a username, or a channel ID itself.
+    """
+    if "youtube.com" in channel:
+        return get_channel_id_locally(channel)
+    if channel.startswith("UC") and len(channel) == 24:
+        return channel
+    return get_channel_id_from_username(channel)
+
+def get_videos(channel, max_results=15, start_date=None, end_date=None) -> List[str]:
+    """
+    IDs of a channel's uploads between two mm/dd/yyyy dates, newest first. Transcripts
+    are no longer fetched here; pass the IDs to channel_ingest (or
+    transcripts.iter_transcripts) to have the worker produce them.
+    """
+    channel_id = resolve_channel_id(channel)
+    if not channel_id:
+        return []
+
+    video_ids = []
+    for page in iter_channel_uploads(channel_id, start_date, end_date):
+        video_ids.extend(video_id for video_id, _ in page)
+        if len(video_ids) >= max_results:
+            break
+    return video_ids[:max_results]
 
 def get_video_duration(video_id) -> datetime.timedelta:
     """